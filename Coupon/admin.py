@@ -1,4 +1,4 @@
 from django.contrib import admin
 from .models import *
 # Register your models here.
-admin.site.register([Coupon, UserProfile])
\ No newline at end of file
+admin.site.register([Coupon, UserProfile, Task])
\ No newline at end of file
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CouponConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Coupon'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        # Count queries of every database connection for the request metrics
+        from . import metrics  # noqa: F401
+        # Register system checks
+        from . import checks  # noqa: F401
@@ -0,0 +1,226 @@
+# async_views.py
+"""
+Async versions of the busiest read endpoints, served under /api/async/.
+
+They return the same payloads as their counterparts in views.py but never
+hold a thread while waiting: rows come from the async ORM and the coupon cache
+through its async methods. Uploaded images are written to storage in a thread
+pool. Run them under the ASGI application (SERVER_MODE=asgi); under WSGI they
+work, but each request still occupies a worker thread.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import models
+from django.db.models import Max, Q
+from django.http import JsonResponse, QueryDict
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from .authentication import request_user_id
+from .cache import acached_payload
+from .models import ChatMessage, Coupon, UserProfile
+from .pagination import CHAT_MAX_PAGE_SIZE, CHAT_PAGE_SIZE, CouponCursorPagination
+from .routers import read_from_replica
+from .serializers import ChatMessageSerializer, CouponSerializer
+from .views import coupon_filters
+
+logger = logging.getLogger(__name__)
+
+PARSERS = [JSONParser(), FormParser(), MultiPartParser()]
+
+
+async def store_uploads(instance):
+    """
+    Write the new uploads of ``instance``'s file fields to storage in a thread
+    pool, so hashing and writing images never blocks the event loop. Saving
+    the instance afterwards keeps the stored names.
+    """
+    for field in instance._meta.fields:
+        if isinstance(field, models.FileField):
+            field_file = getattr(instance, field.attname)
+            if field_file and not field_file._committed:
+                await sync_to_async(field_file.save, thread_sensitive=False)(
+                    field_file.name, field_file.file, save=False,
+                )
+
+
+async def parse_body(request):
+    """
+    Parse a JSON, form or multipart body like the DRF views do. Runs in the
+    request's worker thread because large uploads spill to temporary files.
+    """
+    drf_request = Request(request, parsers=PARSERS)
+    return await sync_to_async(lambda: drf_request.data)()
+
+
+async def coupon_page(request, coupons):
+    # One keyset page of ``coupons`` in the paginated response format
+    paginator = CouponCursorPagination()
+    page = await paginator.apaginate_queryset(coupons, Request(request))
+    return page, paginator
+
+
+# Coupon views
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@read_from_replica
+async def coupon_list_create(request):
+    """
+    GET: Retrieve a page of coupons based on query parameters.
+    POST: Create a new coupon.
+    """
+    if request.method == 'GET':
+        filters = coupon_filters(request)
+
+        async def build_page():
+            coupons = Coupon.objects.active().filter(filters, isAvailed=False)
+            page, paginator = await coupon_page(request, coupons)
+            serializer = CouponSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data).data
+
+        try:
+            return JsonResponse(await acached_payload('coupon_list', request, build_page))
+        except NotFound as e:
+            # Invalid cursor
+            return JsonResponse({'detail': e.detail}, status=404)
+
+    try:
+        data = await parse_body(request)
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+    serializer = CouponSerializer(data=data)
+    if not await sync_to_async(serializer.is_valid)():
+        logger.info("Validation error: %s", serializer.errors)
+        return JsonResponse({'detail': serializer.errors}, status=400)
+
+    # Look the uploader up first so a bad userId leaves no coupon behind
+    try:
+        user_profile = await UserProfile.objects.aget(userId=serializer.validated_data['userId'])
+    except UserProfile.DoesNotExist:
+        return JsonResponse({'detail': {'userId': ['Unknown user.']}}, status=400)
+
+    coupon = Coupon(**serializer.validated_data)
+    await store_uploads(coupon)
+    await coupon.asave()
+    await user_profile.uploadedCoupons.aadd(coupon)
+
+    logger.info("Coupon %s saved", coupon.id)
+    return JsonResponse(CouponSerializer(coupon).data, status=201)
+
+
+@require_http_methods(['GET'])
+@read_from_replica
+async def latest_coupons(request):
+    """
+    GET: Retrieve a page of the latest coupons.
+    """
+    userId = request.GET.get('userId', None)
+
+    async def build_page():
+        coupons = Coupon.objects.active().filter(~Q(userId=userId) if userId else Q(), isAvailed=False)
+        page, paginator = await coupon_page(request, coupons)
+
+        if not page:
+            return {'detail': 'No coupons found for the specified user.'}
+
+        serializer = CouponSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    try:
+        return JsonResponse(await acached_payload('latest_coupons', request, build_page))
+    except NotFound as e:
+        # Invalid cursor
+        return JsonResponse({'detail': e.detail}, status=404)
+    except Exception:
+        logger.exception("Error fetching coupons")
+        return JsonResponse({'detail': 'An error occurred while fetching coupons.'}, status=500)
+
+
+# Chat views
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@read_from_replica
+async def chat_messages(request, user_id, other_user_id):
+    """
+    GET: Retrieve a window of chat messages between two users, oldest first,
+         with the same ?after_id=, ?before_id= and ?limit= as the sync view.
+    POST: Create a new chat message from the token's user.
+    """
+    if request.method == 'GET':
+        try:
+            after_id = int(request.GET['after_id']) if 'after_id' in request.GET else None
+            before_id = int(request.GET['before_id']) if 'before_id' in request.GET else None
+            limit = int(request.GET.get('limit', CHAT_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'detail': 'after_id, before_id and limit must be integers.'}, status=400)
+        limit = max(1, min(limit, CHAT_MAX_PAGE_SIZE))
+
+        conversation = ChatMessage.objects.filter(
+            Q(sender_id=user_id, receiver_id=other_user_id) | Q(sender_id=other_user_id, receiver_id=user_id)
+        )
+
+        # Messages are never edited, so the newest id identifies the state of the conversation
+        last_id = (await conversation.aaggregate(last_id=Max('id')))['last_id'] or 0
+        etag = quote_etag(f'{last_id}-{after_id}-{before_id}-{limit}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        if after_id is not None:
+            window = [message async for message in conversation.filter(id__gt=after_id).order_by('id')[:limit]]
+        else:
+            if before_id is not None:
+                conversation = conversation.filter(id__lt=before_id)
+            window = [message async for message in conversation.order_by('-id')[:limit]][::-1]
+
+        response = JsonResponse(ChatMessageSerializer(window, many=True).data, safe=False)
+        response['ETag'] = etag
+        return response
+
+    # Only the sender may post, like check_acting_user in the sync view
+    token_user_id = request_user_id(request)
+    if token_user_id is None:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'}, status=401, headers={'WWW-Authenticate': 'Bearer'}
+        )
+    if token_user_id != user_id:
+        return JsonResponse({'detail': 'You can only act as yourself.'}, status=403)
+
+    try:
+        sender_profile = await UserProfile.objects.aget(userId=user_id)
+        receiver_profile = await UserProfile.objects.aget(userId=other_user_id)
+    except UserProfile.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    try:
+        data = await parse_body(request)
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+    # Form posts parse into an immutable QueryDict
+    data = data.dict() if isinstance(data, QueryDict) else dict(data)
+    data['sender'] = user_id
+    data['receiver'] = other_user_id
+
+    serializer = ChatMessageSerializer(data=data)
+    if await sync_to_async(serializer.is_valid)():
+        fields = dict(serializer.validated_data, sender=sender_profile, receiver=receiver_profile)
+    else:
+        # Like the sync view, fall back to an empty message rather than rejecting it
+        fields = {
+            'content': data.get('content', ''),
+            'image': data.get('image', ''),
+            'sender': sender_profile,
+            'receiver': receiver_profile,
+        }
+
+    chat_message = ChatMessage(**fields)
+    await store_uploads(chat_message)
+    await chat_message.asave()
+    return JsonResponse(ChatMessageSerializer(chat_message).data, status=201)
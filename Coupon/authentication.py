@@ -0,0 +1,122 @@
+"""
+Stateless signed tokens.
+
+Logging in checks the password hash once and issues two tokens signed with
+SECRET_KEY (django.core.signing): a short-lived access token, verified on
+every request without touching the database, and a longer-lived refresh token
+that trades for a new pair. Refresh tokens carry a fingerprint of the password
+hash, so changing the password invalidates them.
+"""
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import UserProfile
+
+ACCESS_SALT = 'Coupon.authentication.access'
+REFRESH_SALT = 'Coupon.authentication.refresh'
+
+
+def access_token_lifetime():
+    return getattr(settings, 'ACCESS_TOKEN_LIFETIME', 15 * 60)
+
+
+def refresh_token_lifetime():
+    return getattr(settings, 'REFRESH_TOKEN_LIFETIME', 24 * 60 * 60)
+
+
+def password_fingerprint(user_profile):
+    return salted_hmac(REFRESH_SALT, user_profile.password).hexdigest()[:16]
+
+
+def issue_tokens(user_profile):
+    """
+    Return a new access/refresh token pair for ``user_profile``.
+    """
+    return {
+        'access': signing.dumps({'sub': user_profile.userId}, salt=ACCESS_SALT),
+        'refresh': signing.dumps(
+            {'sub': user_profile.userId, 'pwd': password_fingerprint(user_profile)}, salt=REFRESH_SALT,
+        ),
+        'expiresIn': access_token_lifetime(),
+    }
+
+
+def read_access_token(token):
+    """
+    Return the userId an access token was issued to; raises signing.BadSignature
+    (or its subclass SignatureExpired) when it is forged or too old.
+    """
+    return signing.loads(token, salt=ACCESS_SALT, max_age=access_token_lifetime())['sub']
+
+
+def request_user_id(request):
+    """
+    The userId of the request's bearer token, or None without a valid one.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) == 2 and header[0].lower() == 'bearer':
+        try:
+            return read_access_token(header[1])
+        except signing.BadSignature:
+            pass
+    return None
+
+
+def refresh_tokens(refresh_token):
+    """
+    Exchange a refresh token for a new token pair, or return None when it is
+    invalid, expired, or the password changed since it was issued.
+    """
+    try:
+        payload = signing.loads(refresh_token, salt=REFRESH_SALT, max_age=refresh_token_lifetime())
+    except signing.BadSignature:
+        return None
+
+    user_profile = UserProfile.objects.filter(userId=payload['sub']).only('userId', 'password').first()
+    if user_profile is None or not constant_time_compare(payload['pwd'], password_fingerprint(user_profile)):
+        return None
+    return issue_tokens(user_profile)
+
+
+class TokenUser:
+    """
+    The user behind a verified access token; only knows its userId.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id):
+        self.userId = user_id
+        self.pk = user_id
+
+    def __str__(self):
+        return self.userId
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate ``Authorization: Bearer <access token>`` without a database query.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() != self.keyword:
+            return None
+        if len(parts) != 2:
+            raise AuthenticationFailed('Invalid Authorization header.')
+
+        token = parts[1].decode('ascii', errors='replace')
+        try:
+            user_id = read_access_token(token)
+        except signing.SignatureExpired:
+            raise AuthenticationFailed('Access token expired.')
+        except signing.BadSignature:
+            raise AuthenticationFailed('Invalid access token.')
+        return TokenUser(user_id), token
+
+    def authenticate_header(self, request):
+        return 'Bearer'
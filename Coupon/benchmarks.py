@@ -0,0 +1,153 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks never touch the configured database: they run against a throwaway
+test database created with Django's test database machinery.
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from .models import ChatMessage, Coupon, UserProfile
+
+CATEGORIES = ['Food', 'Travel', 'Fashion', 'Electronics', 'Grocery', 'Movies', 'Health', 'Education']
+COMPANIES = ['Swiggy', 'Zomato', 'Myntra', 'Amazon', 'Flipkart', 'Uber', 'Ola', 'BigBasket', 'Nykaa', 'BookMyShow']
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Create a fresh test database for the duration of the block and drop it afterwards.
+    """
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # SQLite's default in-memory test database cannot take writes from several threads
+        # (and cannot be reached from other processes)
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if not test_settings.get('NAME'):
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'coupons_benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    # Point replicas at the test database too, so routed reads see the seeded data
+    for alias in connections:
+        if connections[alias].settings_dict.get('TEST', {}).get('MIRROR') == DEFAULT_DB_ALIAS:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def seed_coupons(count, user_ids, availed_ratio=0.8, batch_size=10000, seed=0):
+    """
+    Bulk insert ``count`` coupons spread across ``user_ids``.
+
+    About ``availed_ratio`` of them are already availed and a small share is
+    expired, which mirrors a catalog that has been live for a while.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    batch = []
+
+    for i in range(count):
+        batch.append(Coupon(
+            userId=rng.choice(user_ids),
+            companyName=rng.choice(COMPANIES),
+            description=f'Flat {rng.randint(5, 70)}% off on order #{i}',
+            category=rng.choice(CATEGORIES),
+            isAvailed=rng.random() < availed_ratio,
+            validityDate=today + timedelta(days=rng.randint(-30, 365)),
+            couponCode=f'CODE{i:08d}',
+        ))
+        if len(batch) >= batch_size:
+            Coupon.objects.bulk_create(batch)
+            batch = []
+
+    if batch:
+        Coupon.objects.bulk_create(batch)
+
+
+def seed_dataset(users, coupons, availed_ratio=0.5, chats=0, messages_per_chat=0,
+                 password='benchmark', batch_size=10000, seed=0):
+    """
+    Seed users, coupons, their uploadedCoupons/availedCoupons links and chat
+    histories, and return what the benchmark scenarios need to address them.
+
+    Every user shares ``password`` (hashed once, since hashing is deliberately slow).
+    """
+    rng = random.Random(seed)
+    user_ids = [f'user{i}@example.com' for i in range(users)]
+    password_hash = make_password(password)
+    UserProfile.objects.bulk_create(
+        [UserProfile(userId=user_id, email=user_id, userName=f'User {i}', password=password_hash)
+         for i, user_id in enumerate(user_ids)],
+        batch_size=batch_size,
+    )
+
+    seed_coupons(coupons, user_ids, availed_ratio=availed_ratio, batch_size=batch_size, seed=seed)
+
+    # Link every coupon to its uploader, and availed ones to a random claimant
+    Uploaded = UserProfile.uploadedCoupons.through
+    Availed = UserProfile.availedCoupons.through
+    uploaded, availed = [], []
+    for coupon_id, uploader, is_availed in Coupon.objects.values_list('id', 'userId', 'isAvailed').iterator():
+        uploaded.append(Uploaded(userprofile_id=uploader, coupon_id=coupon_id))
+        if is_availed:
+            availed.append(Availed(userprofile_id=rng.choice(user_ids), coupon_id=coupon_id))
+    Uploaded.objects.bulk_create(uploaded, batch_size=batch_size)
+    Availed.objects.bulk_create(availed, batch_size=batch_size)
+
+    chat_pairs = [tuple(rng.sample(user_ids, 2)) for _ in range(chats)] if users > 1 else []
+    messages = []
+    for first, second in chat_pairs:
+        for i in range(messages_per_chat):
+            sender, receiver = (first, second) if rng.random() < 0.5 else (second, first)
+            messages.append(ChatMessage(sender_id=sender, receiver_id=receiver, content=f'Message {i}'))
+            if len(messages) >= batch_size:
+                ChatMessage.objects.bulk_create(messages)
+                messages = []
+    if messages:
+        ChatMessage.objects.bulk_create(messages)
+    # bulk_create skips ChatMessage.save(), so build the inbox rows afterwards
+    call_command('backfill_conversations', stdout=StringIO())
+
+    return {
+        'user_ids': user_ids,
+        'password': password,
+        'open_coupon_ids': list(Coupon.objects.active().filter(isAvailed=False).values_list('id', flat=True)),
+        'coupon_ids': list(Coupon.objects.values_list('id', flat=True)),
+        'chat_pairs': chat_pairs,
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(func, repeat):
+    """
+    Call ``func`` ``repeat`` times and return latency stats in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+    }
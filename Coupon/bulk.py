@@ -0,0 +1,101 @@
+"""
+Bulk coupon uploads.
+
+Rows are validated with CouponSerializer and written in batches: one
+bulk_create for the coupons and one for their uploadedCoupons links per
+batch, each batch in its own transaction. bulk_create skips model signals,
+so the search index and the coupon cache are updated here directly, once
+per batch. Where bulk_create cannot return the new ids (MySQL), the batch's
+rows are tagged with an uploadBatch marker and their ids read back with one
+query.
+"""
+import uuid
+from itertools import islice
+
+from django.db import connection, transaction
+
+from . import cache
+from .models import Coupon, UserProfile
+from .search import update_index
+from .serializers import CouponSerializer
+
+BULK_BATCH_SIZE = 500
+
+# Files cannot be sent in a bulk upload
+IGNORED_COLUMNS = ('id', 'screenshots')
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def validate_batch(batch, first_row):
+    """
+    Return (coupons, errors) for a batch of row dicts. Rows are numbered from 1.
+    """
+    user_ids = {row.get('userId') for row in batch if isinstance(row, dict)}
+    known_users = set(UserProfile.objects.filter(userId__in=user_ids).values_list('userId', flat=True))
+
+    coupons = []
+    errors = []
+    for number, row in enumerate(batch, start=first_row):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'non_field_errors': ['Expected an object.']}})
+            continue
+
+        row = {key: value for key, value in row.items() if key not in IGNORED_COLUMNS}
+        serializer = CouponSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'row': number, 'errors': serializer.errors})
+        elif serializer.validated_data['userId'] not in known_users:
+            errors.append({'row': number, 'errors': {'userId': ['User does not exist.']}})
+        else:
+            coupons.append(Coupon(**serializer.validated_data))
+    return coupons, errors
+
+
+def insert_batch(coupons):
+    """
+    Insert ``coupons`` and link them to their uploaders in one transaction.
+    """
+    if not coupons:
+        return []
+
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Coupon.objects.bulk_create(coupons)
+        else:
+            marker = uuid.uuid4().hex
+            for coupon in coupons:
+                coupon.uploadBatch = marker
+            Coupon.objects.bulk_create(coupons)
+            # Ids grow in insertion order, so they pair up with the rows as sent
+            ids = Coupon.objects.filter(uploadBatch=marker).order_by('id').values_list('id', flat=True)
+            for coupon, coupon_id in zip(coupons, ids):
+                coupon.id = coupon.pk = coupon_id
+
+        transaction.on_commit(lambda: [update_index(coupon) for coupon in coupons])
+
+        Through = UserProfile.uploadedCoupons.through
+        Through.objects.bulk_create(
+            [Through(userprofile_id=coupon.userId, coupon_id=coupon.id) for coupon in coupons]
+        )
+        transaction.on_commit(cache.invalidate)
+    return [coupon.id for coupon in coupons]
+
+
+def upload_coupons(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Validate and insert ``rows`` batch by batch, yielding a progress dict per batch.
+    """
+    processed = 0
+    for batch in batches(rows, batch_size):
+        coupons, errors = validate_batch(batch, first_row=processed + 1)
+        ids = insert_batch(coupons)
+        processed += len(batch)
+        yield {'processed': processed, 'created': ids, 'errors': errors}
@@ -0,0 +1,163 @@
+"""
+Cached payloads for the coupon feed and listings.
+
+Entries are keyed by endpoint, URL and a generation number. Any coupon change
+bumps the generation, which retires every cached page at once without tracking
+individual keys (see signals.py). Pages may be cached per process, but the
+generation lives in a cache every server process shares (the database, or
+Redis), so a write handled by one process retires the pages of all of them.
+
+For REPLICA_PIN_SECONDS after a bump the replica may not have the write yet,
+so pages missed in that window are built from the primary; otherwise stale
+pages would be cached under the new generation.
+"""
+import hashlib
+import threading
+import time
+from contextlib import nullcontext
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .routers import primary_reads, reading_from_replica
+
+CACHE_ALIAS = 'coupons'
+GENERATION_CACHE_ALIAS = 'coupon_generation'
+GENERATION_KEY = 'coupons:generation'
+INVALIDATED_AT_KEY = 'coupons:invalidated_at'
+
+
+class CacheStats:
+    """
+    Per-process hit/miss counters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_generation_cache():
+    return caches[GENERATION_CACHE_ALIAS]
+
+
+def generation():
+    cache = get_generation_cache()
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Start from the clock so a lost generation never revives old entries
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+async def ageneration():
+    cache = get_generation_cache()
+    value = await cache.aget(GENERATION_KEY)
+    if value is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), timeout=None)
+        value = await cache.aget(GENERATION_KEY)
+    return value
+
+
+def invalidate():
+    """
+    Retire every cached coupon payload.
+    """
+    cache = get_generation_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+    cache.set(INVALIDATED_AT_KEY, time.time(), timeout=None)
+    with stats.lock:
+        stats.invalidations += 1
+
+
+def within_replica_lag(invalidated_at):
+    return time.time() - (invalidated_at or 0) < getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def fill_reads():
+    """
+    Where a cache miss reads from: the primary when the replica may still lag behind the last write.
+    """
+    if reading_from_replica() and within_replica_lag(get_generation_cache().get(INVALIDATED_AT_KEY)):
+        return primary_reads()
+    return nullcontext()
+
+
+async def afill_reads():
+    if reading_from_replica() and within_replica_lag(await get_generation_cache().aget(INVALIDATED_AT_KEY)):
+        return primary_reads()
+    return nullcontext()
+
+
+def payload_key(name, request, generation_value=None):
+    # Sort the query so equivalent URLs share an entry; include the date so
+    # coupons drop out of cached pages on the day they expire
+    query = sorted(request.GET.lists())
+    raw = f'{request.get_host()}{request.path}?{query}'
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    if generation_value is None:
+        generation_value = generation()
+    return f'coupons:{generation_value}:{date.today().isoformat()}:{name}:{digest}'
+
+
+def cached_payload(name, request, build):
+    """
+    Return the cached payload for this request, calling ``build()`` on a miss.
+    """
+    cache = get_cache()
+    key = payload_key(name, request)
+
+    payload = cache.get(key)
+    stats.record(hit=payload is not None)
+    if payload is None:
+        with fill_reads():
+            payload = build()
+        cache.set(key, payload, getattr(settings, 'COUPON_CACHE_TIMEOUT', 300))
+    return payload
+
+
+async def acached_payload(name, request, build):
+    """
+    cached_payload() for async views; ``build`` is a coroutine function.
+    """
+    cache = get_cache()
+    key = payload_key(name, request, await ageneration())
+
+    payload = await cache.aget(key)
+    stats.record(hit=payload is not None)
+    if payload is None:
+        with await afill_reads():
+            payload = await build()
+        await cache.aset(key, payload, getattr(settings, 'COUPON_CACHE_TIMEOUT', 300))
+    return payload
@@ -0,0 +1,64 @@
+"""
+System checks for running several server processes.
+
+Rate limit buckets and the channel layer are kept in each process unless
+they are pointed at a shared store. With one process that is fine; with
+SERVER_PROCESSES > 1 every process would allow the full rate and chat pushes
+would miss sockets held by other processes, so `manage.py check` (run by
+`migrate` and by gunicorn before it starts its workers) reports an error.
+"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# Cache backends whose entries only the writing process sees
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@register()
+def check_shared_state(app_configs, **kwargs):
+    processes = getattr(settings, 'SERVER_PROCESSES', 1)
+    if processes <= 1:
+        return []
+
+    errors = []
+    if getattr(settings, 'RATE_LIMITS', {}):
+        backend = getattr(settings, 'RATE_LIMIT_BACKEND', 'Coupon.ratelimit.MemoryBackend')
+        if backend == 'Coupon.ratelimit.MemoryBackend' or (
+            backend == 'Coupon.ratelimit.CacheBackend' and is_process_local(getattr(settings, 'RATE_LIMIT_CACHE', 'default'))
+        ):
+            errors.append(Error(
+                f'Rate limits are counted per process, so {processes} server processes allow {processes} times the configured rates.',
+                hint='Set RATE_LIMIT_BACKEND=Coupon.ratelimit.CacheBackend and RATE_LIMIT_REDIS_URL.',
+                id='Coupon.E001',
+            ))
+
+    if getattr(settings, 'SERVER_MODE', 'wsgi') == 'asgi' and (
+        settings.CHANNEL_LAYERS['default']['BACKEND'] == 'channels.layers.InMemoryChannelLayer'
+    ):
+        errors.append(Error(
+            'The in-memory channel layer only reaches chat sockets held by the same server process.',
+            hint='Set CHANNEL_REDIS_URL.',
+            id='Coupon.E002',
+        ))
+
+    if is_process_local('coupon_generation'):
+        errors.append(Error(
+            'The coupon cache generation is kept per process, so a write only retires the pages cached by the process that handled it.',
+            hint='Use the default database cache for "coupon_generation", or set COUPON_CACHE_REDIS_URL.',
+            id='Coupon.E003',
+        ))
+
+    if getattr(settings, 'COUPON_SEARCH_BACKEND', '') == 'Coupon.search.InvertedIndexBackend':
+        errors.append(Warning(
+            f'Each of the {processes} server processes builds its own search index; coupons written through '
+            'another process are found after up to COUPON_SEARCH_MAX_AGE seconds.',
+            id='Coupon.W001',
+        ))
+    return errors
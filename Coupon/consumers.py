@@ -0,0 +1,64 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core import signing
+from django.db.models import Q
+
+from .authentication import read_access_token
+from .models import ChatMessage
+from .realtime import chat_group_name
+from .serializers import ChatMessageSerializer
+
+# Maximum number of missed messages replayed when a client resumes
+RESUME_LIMIT = 500
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Streams every new message sent or received by ``user_id``.
+
+    Browsers cannot set headers on a WebSocket, so clients pass their access
+    token as ``?token=``; the socket is refused unless it was issued to
+    ``user_id``. Clients reconnecting with ``?since=<message id>`` first
+    receive the messages they missed. A message can arrive twice around a
+    reconnect, so clients should de-duplicate on ``id``.
+    """
+
+    async def connect(self):
+        self.user_id = self.scope['url_route']['kwargs']['user_id']
+        self.group_name = chat_group_name(self.user_id)
+        query = parse_qs(self.scope['query_string'].decode())
+
+        if not self.authorized(query.get('token', [''])[0]):
+            # Closing before accepting rejects the handshake
+            await self.close()
+            return
+
+        # Join the group before replaying so nothing sent in between is lost
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        since = query.get('since')
+        if since and since[0].isdigit():
+            for message in await self.messages_since(int(since[0])):
+                await self.send_json(message)
+
+    def authorized(self, token):
+        try:
+            return read_access_token(token) == self.user_id
+        except signing.BadSignature:
+            return False
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def chat_message(self, event):
+        await self.send_json(event['message'])
+
+    @database_sync_to_async
+    def messages_since(self, message_id):
+        messages = ChatMessage.objects.filter(
+            Q(sender_id=self.user_id) | Q(receiver_id=self.user_id), id__gt=message_id
+        ).order_by('id')[:RESUME_LIMIT]
+        return ChatMessageSerializer(messages, many=True).data
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.db import transaction
+
+from .models import Coupon
+from .tasks import task
+
+# Number of coupons deleted per transaction by the expiry sweeper
+DEFAULT_BATCH_SIZE = 500
+
+
+def purge_expired_coupons(batch_size=DEFAULT_BATCH_SIZE, today=None):
+    """
+    Delete expired coupons in bounded batches.
+
+    Each batch runs in its own short transaction, so the locks taken on the
+    coupon table and the availedCoupons/uploadedCoupons join tables are
+    released between batches. Returns the number of coupons deleted.
+    """
+    today = today or date.today()
+    deleted = 0
+
+    while True:
+        ids = list(
+            Coupon.objects.expired(today).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+
+        with transaction.atomic():
+            _, per_model = Coupon.objects.filter(id__in=ids).delete()
+        deleted += per_model.get(Coupon._meta.label, 0)
+
+
+@task(queue='maintenance')
+def purge_expired_coupons_task(batch_size=DEFAULT_BATCH_SIZE):
+    # Runs every TASK_SCHEDULE seconds on a task worker
+    purge_expired_coupons(batch_size=batch_size)
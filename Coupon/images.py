@@ -0,0 +1,120 @@
+"""
+Resized WebP variants of uploaded images.
+
+Every stored coupon screenshot, profile image and chat image gets a small
+thumbnail and a full-size WebP copy next to the original. Variants are made
+by a background task on the "images" queue, so requests never wait for them;
+until a variant exists its URL returns 404 and clients fall back to the
+original.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import ChatMessage, Coupon, UserProfile
+from .tasks import Retry, enqueue, task
+
+# Variant name -> bounding box (None keeps the original size); all variants are WebP
+VARIANTS = {
+    'thumbnail': (320, 320),
+    'full': None,
+}
+
+WEBP_QUALITY = 80
+
+# Seconds a stored image stays after it was last saved, so an upload of the
+# same bytes can commit the row referencing it before the file is released
+REUSE_GRACE_SECONDS = 300
+
+# Image field of each model that gets resized variants
+IMAGE_FIELDS = {
+    Coupon: 'screenshots',
+    UserProfile: 'userImage',
+    ChatMessage: 'image',
+}
+
+def variant_name(name, variant):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{variant}.webp'
+
+
+def variant_urls(name, storage=default_storage):
+    return {variant: storage.url(variant_name(name, variant)) for variant in VARIANTS}
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Write the missing variants of the stored image ``name``.
+    """
+    missing = [variant for variant in VARIANTS if not storage.exists(variant_name(name, variant))]
+    if not missing:
+        return
+
+    with storage.open(name, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    for variant in missing:
+        resized = image.copy()
+        if VARIANTS[variant]:
+            resized.thumbnail(VARIANTS[variant])
+
+        buffer = BytesIO()
+        resized.save(buffer, format='WEBP', quality=WEBP_QUALITY)
+        # Variants live next to their original, so bypass content addressing if the storage does it
+        save = getattr(storage, 'save_exact', storage.save)
+        save(variant_name(name, variant), ContentFile(buffer.getvalue()))
+
+
+@task(queue='images', max_attempts=3)
+def generate_variants_task(name):
+    generate_variants(name)
+
+
+def schedule_variants(field_file):
+    """
+    Queue variant generation for an image field value; no-op when it is empty.
+    """
+    if field_file:
+        enqueue(generate_variants_task, args=[field_file.name], key=f'variants:{field_file.name}')
+
+
+@task(queue='images')
+def release_unreferenced_task(name):
+    release_unreferenced(name)
+
+
+def schedule_release(name):
+    """
+    Queue the deletion of a stored image that may no longer be referenced.
+    """
+    enqueue(release_unreferenced_task, args=[name], key=f'release:{name}')
+
+
+def is_referenced(name):
+    return any(model.objects.filter(**{field_name: name}).exists() for model, field_name in IMAGE_FIELDS.items())
+
+
+def release_unreferenced(name, storage=default_storage, grace=REUSE_GRACE_SECONDS):
+    """
+    Delete a stored image and its variants once no row references it.
+
+    Identical uploads share one stored file, so a file can only go when the
+    last coupon, profile or message pointing at it is gone. Returns True when
+    the file was deleted. Files saved in the last ``grace`` seconds may be
+    about to be referenced again; for them tasks.Retry is raised so the task
+    checks again later.
+    """
+    if is_referenced(name):
+        return False
+    if storage.used_within(name, grace):
+        raise Retry(grace)
+
+    if not storage.delete_unreferenced(name, lambda: is_referenced(name), grace):
+        return False
+    for variant in VARIANTS:
+        storage.delete(variant_name(name, variant))
+    return True
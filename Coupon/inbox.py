@@ -0,0 +1,42 @@
+"""
+Building Conversation inbox rows from chat messages that predate them.
+
+Used by the backfill_conversations command and by migration 0016, so it takes
+the models as arguments: migrations pass their historical versions.
+"""
+from django.db import connections
+from django.db.models import Max
+
+
+def backfill_conversations(chat_message_model, conversation_model, using='default', batch_size=1000):
+    """
+    Point every (owner, peer) inbox row at the newest message between the two,
+    creating missing rows. Returns the number of rows written.
+    """
+    # Newest message id per (owner, peer), looking at both directions of each chat
+    last_ids = {}
+    pairs = chat_message_model.objects.using(using).values('sender_id', 'receiver_id').annotate(last_id=Max('id')).order_by()
+    for pair in pairs.iterator():
+        for owner_id, peer_id in ((pair['sender_id'], pair['receiver_id']), (pair['receiver_id'], pair['sender_id'])):
+            key = (owner_id, peer_id)
+            last_ids[key] = max(last_ids.get(key, 0), pair['last_id'])
+
+    # MySQL has no conflict target and upserts on any unique key, here (owner, peer)
+    upsert = {'update_conflicts': True, 'update_fields': ['last_message', 'last_timestamp']}
+    if connections[using].features.supports_update_conflicts_with_target:
+        upsert['unique_fields'] = ['owner', 'peer']
+
+    items = list(last_ids.items())
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        timestamps = dict(
+            chat_message_model.objects.using(using).filter(id__in=[last_id for _, last_id in chunk]).values_list('id', 'timestamp')
+        )
+        conversation_model.objects.using(using).bulk_create(
+            [
+                conversation_model(owner_id=owner_id, peer_id=peer_id, last_message_id=last_id, last_timestamp=timestamps[last_id])
+                for (owner_id, peer_id), last_id in chunk
+            ],
+            **upsert,
+        )
+    return len(items)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from Coupon.inbox import backfill_conversations
+from Coupon.models import ChatMessage, Conversation
+
+
+class Command(BaseCommand):
+    help = 'Build the Conversation inbox rows from existing chat messages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per query.')
+
+    def handle(self, *args, **options):
+        count = backfill_conversations(ChatMessage, Conversation, batch_size=options['batch_size'])
+        self.stdout.write(f'Backfilled {count} conversations')
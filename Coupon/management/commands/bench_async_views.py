@@ -0,0 +1,95 @@
+import os
+import random
+import sys
+
+from django.conf import settings
+
+from Coupon.benchmarks import benchmark_database, seed_dataset
+
+from .bench_serving import Command as ServingCommand
+
+# Mode -> (SERVER_MODE, URL prefix of the views under test)
+MODES = {
+    'wsgi': ('wsgi', '/api/'),
+    'asgi-sync': ('asgi', '/api/'),
+    'asgi-async': ('asgi', '/api/async/'),
+}
+
+
+class Command(ServingCommand):
+    help = (
+        'Compare how throughput and latency scale with client concurrency for the sync views '
+        '(gunicorn threads, or ASGI running them in threads) and the async views under /api/async/, '
+        'with the same number of worker processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES), help='Setups to compare.')
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 8, 32, 64],
+            help='Client concurrency levels to sweep.',
+        )
+        parser.add_argument('--duration', type=float, default=5, help='Seconds of load per concurrency level.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes, the same for every mode.')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per WSGI worker.')
+        parser.add_argument('--port', type=int, default=8765, help='Port the servers listen on.')
+        parser.add_argument('--users', type=int, default=200, help='Number of seeded users.')
+        parser.add_argument('--coupons', type=int, default=5000, help='Number of seeded coupons.')
+        parser.add_argument('--chats', type=int, default=200, help='Number of seeded chats.')
+        parser.add_argument('--messages-per-chat', type=int, default=50, help='Messages seeded per chat.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            data = seed_dataset(
+                users=options['users'],
+                coupons=options['coupons'],
+                chats=options['chats'],
+                messages_per_chat=options['messages_per_chat'],
+            )
+            env = self.server_env()
+            paths = self.paths(data)
+
+            self.stdout.write(f"{'mode':<11} {'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+            for mode in options['modes']:
+                prefix = MODES[mode][1]
+                mode_paths = [prefix + path for path in paths]
+
+                def sweep(base_url):
+                    for concurrency in options['concurrency']:
+                        result = self.load(base_url, concurrency, options['duration'], paths=mode_paths)
+                        self.stdout.write(
+                            f'{mode:<11} {concurrency:>7} {result["rps"]:>9.1f} {result["p50_ms"]:>9.1f} '
+                            f'{result["p99_ms"]:>9.1f} {result["errors"]:>7}'
+                        )
+                    return {}
+
+                self.run_server(mode, env, options, run_load=sweep)
+
+    def paths(self, data):
+        """
+        The endpoints that have async versions: latest coupons and the listing
+        per user (cached per URL), and uncached chat history windows.
+        """
+        rng = random.Random(0)
+        paths = []
+        for _ in range(50):
+            user_id = rng.choice(data['user_ids'])
+            paths.append(f'coupons/latest/?userId={user_id}')
+            paths.append(f'coupons/?userId={user_id}&limit=50')
+            if data['chat_pairs']:
+                first, second = rng.choice(data['chat_pairs'])
+                paths.append(f'chat/messages/{first}/{second}/')
+                paths.append(f'chat/messages/{second}/{first}/?limit=20')
+        return paths
+
+    def command(self, mode, options):
+        return (
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')],
+            {
+                'DJANGO_DEBUG': 'False',
+                'SERVER_MODE': MODES[mode][0],
+                'BIND': f'127.0.0.1:{options["port"]}',
+                'WEB_CONCURRENCY': str(options['workers']),
+                'WEB_THREADS': str(options['threads']),
+            },
+        )
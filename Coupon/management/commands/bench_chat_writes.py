@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from Coupon.authentication import issue_tokens
+from Coupon.benchmarks import benchmark_database
+from Coupon.models import ChatMessage, UserProfile
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class Command(BaseCommand):
+    help = 'Measure statements and throughput per chat message written, through the ORM and the API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000, help='Messages written per phase.')
+        parser.add_argument('--users', type=int, default=100, help='Number of chatting users to seed.')
+        parser.add_argument('--chats', type=int, default=200, help='Number of distinct two-person chats.')
+
+    def handle(self, *args, **options):
+        # Thousands of messages from one client would mostly be answered with 429
+        with benchmark_database(), override_settings(RATE_LIMITS={}):
+            user_ids = [f'user{i}@example.com' for i in range(options['users'])]
+            UserProfile.objects.bulk_create(
+                [UserProfile(userId=user_id, email=user_id, userName=user_id) for user_id in user_ids]
+            )
+            rng = random.Random(0)
+            chats = [tuple(rng.sample(user_ids, 2)) for _ in range(options['chats'])]
+            pairs = [rng.choice(chats)[::rng.choice((1, -1))] for _ in range(options['messages'])]
+            client = Client()
+            tokens = {user_id: f'Bearer {issue_tokens(UserProfile(userId=user_id))["access"]}' for user_id in user_ids}
+
+            self.report('ORM ChatMessage.objects.create', pairs, lambda sender, receiver: ChatMessage.objects.create(
+                sender_id=sender, receiver_id=receiver, content='hello'
+            ))
+            self.report('POST chat/messages/<a>/<b>/', pairs, lambda sender, receiver: client.post(
+                f'/api/chat/messages/{sender}/{receiver}/', {'content': 'hello'}, content_type='application/json',
+                HTTP_AUTHORIZATION=tokens[sender],
+            ))
+
+    def report(self, label, pairs, send):
+        counts = {'statements': 0, 'writes': 0}
+
+        def count(execute, sql, params, many, context):
+            counts['statements'] += 1
+            if sql.lstrip().upper().startswith(WRITE_PREFIXES):
+                counts['writes'] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            for sender, receiver in pairs:
+                send(sender, receiver)
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{label}: {len(pairs) / elapsed:.0f} messages/s, '
+            f"{counts['statements'] / len(pairs):.2f} statements/message, "
+            f"{counts['writes'] / len(pairs):.2f} writes/message"
+        )
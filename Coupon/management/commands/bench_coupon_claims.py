@@ -0,0 +1,92 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from Coupon.authentication import issue_tokens
+from Coupon.benchmarks import benchmark_database, seed_coupons
+from Coupon.models import Coupon, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent claims at a small set of coupons from many threads and check that '
+        'every coupon has exactly one winner.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--coupons', type=int, default=50, help='Number of contested coupons.')
+        parser.add_argument('--users', type=int, default=200, help='Number of claiming users.')
+        parser.add_argument('--threads', type=int, default=16, help='Number of concurrent client threads.')
+        parser.add_argument('--claims', type=int, default=5000, help='Total claim requests.')
+
+    def handle(self, *args, **options):
+        # The claims come from one IP at many times the claim limit; measure the claims, not 429s
+        with benchmark_database(), override_settings(RATE_LIMITS={}):
+            user_ids = [f'user{i}@example.com' for i in range(options['users'])]
+            UserProfile.objects.bulk_create(
+                [UserProfile(userId=user_id, email=user_id, userName=user_id) for user_id in user_ids]
+            )
+            seed_coupons(options['coupons'], user_ids, availed_ratio=0)
+            Coupon.objects.update(validityDate='2999-12-31')
+            coupon_ids = list(Coupon.objects.values_list('id', flat=True))
+
+            tokens = {user_id: f'Bearer {issue_tokens(UserProfile(userId=user_id))["access"]}' for user_id in user_ids}
+
+            rng = random.Random(0)
+            claims = [(rng.choice(coupon_ids), rng.choice(user_ids)) for _ in range(options['claims'])]
+            per_thread = [claims[i::options['threads']] for i in range(options['threads'])]
+
+            statuses = Counter()
+            winners = Counter()
+            lock = threading.Lock()
+
+            def worker(batch):
+                client = Client(raise_request_exception=False)
+                try:
+                    for coupon_id, user_id in batch:
+                        response = client.post(
+                            f'/api/coupons/{coupon_id}/avail/{user_id}/', HTTP_AUTHORIZATION=tokens[user_id]
+                        )
+                        with lock:
+                            statuses[response.status_code] += 1
+                            if response.status_code == 201:
+                                winners[coupon_id] += 1
+                finally:
+                    connection.close()
+
+            # Losing claims are logged as warnings by django.request; keep the report readable
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+            threads = [threading.Thread(target=worker, args=(batch,)) for batch in per_thread]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            holders = Counter(
+                UserProfile.availedCoupons.through.objects.values_list('coupon_id', flat=True)
+            )
+            availed = Coupon.objects.filter(isAvailed=True).count()
+
+        self.stdout.write(f'{len(claims)} claims in {elapsed:.2f}s: {len(claims) / elapsed:.0f} claims/s')
+        self.stdout.write(f'Responses: {dict(sorted(statuses.items()))}')
+        if statuses[500] and connection.vendor == 'sqlite':
+            self.stdout.write('500s are SQLite "database is locked" errors under write contention')
+
+        contested = set(coupon_id for coupon_id, _ in claims)
+        problems = [
+            coupon_id for coupon_id in contested
+            if winners[coupon_id] != 1 or holders[coupon_id] != 1
+        ]
+        if problems or availed != len(contested):
+            raise CommandError(f'Coupons without exactly one winner: {sorted(problems)}')
+        self.stdout.write(f'OK: each of the {len(contested)} contested coupons has exactly one winner')
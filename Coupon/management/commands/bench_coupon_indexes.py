@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from Coupon.benchmarks import benchmark_database, measure, seed_coupons
+from Coupon.models import Coupon, UserProfile
+
+ENDPOINTS = [
+    ('coupon list', '/api/coupons/', {}),
+    ('coupon list by category', '/api/coupons/', {'category': 'Travel'}),
+    ('coupon list by category, other users', '/api/coupons/', {'category': 'Travel', 'userId': 'user0@example.com'}),
+    ('latest coupons', '/api/coupons/latest/', {'limit': 20}),
+    ('latest coupons, other users', '/api/coupons/latest/', {'limit': 20, 'userId': 'user0@example.com'}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with coupons and report p50/p99 latency of the coupon '
+        'endpoints without and with the Coupon indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--coupons', type=int, default=1_000_000, help='Number of coupons to seed.')
+        parser.add_argument('--users', type=int, default=1000, help='Number of uploading users to seed.')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint and phase.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user_ids = [f'user{i}@example.com' for i in range(options['users'])]
+            UserProfile.objects.bulk_create(
+                [UserProfile(userId=user_id, email=user_id, userName=user_id) for user_id in user_ids]
+            )
+            self.stdout.write(f"Seeding {options['coupons']} coupons...")
+            seed_coupons(options['coupons'], user_ids)
+
+            indexes = Coupon._meta.indexes
+
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.remove_index(Coupon, index)
+            before = self.run_endpoints(options['repeat'])
+
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.add_index(Coupon, index)
+            after = self.run_endpoints(options['repeat'])
+
+        self.stdout.write(f"{'endpoint':<40} {'before p50':>11} {'before p99':>11} {'after p50':>11} {'after p99':>11}")
+        for label, _, _ in ENDPOINTS:
+            self.stdout.write(
+                f"{label:<40} {before[label]['p50_ms']:>11} {before[label]['p99_ms']:>11} "
+                f"{after[label]['p50_ms']:>11} {after[label]['p99_ms']:>11}"
+            )
+
+    def run_endpoints(self, repeat):
+        client = Client()
+        results = {}
+        # Measure the queries, not the coupon page cache
+        no_cache = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with override_settings(CACHES={**settings.CACHES, 'coupons': no_cache, 'coupon_generation': no_cache}):
+            for label, url, params in ENDPOINTS:
+                results[label] = measure(lambda: client.get(url, params), repeat)
+        return results
@@ -0,0 +1,187 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from Coupon.benchmarks import benchmark_database, percentile, seed_coupons
+from Coupon.models import UserProfile
+from Coupon.routers import REPLICA_ALIAS
+
+SERVERS = ['runserver', 'wsgi', 'asgi']
+
+# Read-only mix of the busiest endpoints
+PATHS = [
+    '/api/coupons/latest/',
+    '/api/coupons/?category=Food',
+    '/api/coupons/?limit=50',
+    '/api/coupons/search/?q=swig',
+    '/api/user-profile/user0@example.com/',
+    '/api/health/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the development server against the production gunicorn setups '
+        '(WSGI with threads, ASGI with uvicorn) on the same seeded test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=SERVERS, default=SERVERS, help='Servers to compare.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Number of concurrent client threads.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server.')
+        parser.add_argument('--workers', type=int, default=4, help='Gunicorn worker processes.')
+        parser.add_argument('--port', type=int, default=8765, help='Port the servers listen on.')
+        parser.add_argument('--coupons', type=int, default=5000, help='Number of seeded coupons.')
+        parser.add_argument('--users', type=int, default=200, help='Number of seeded users.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user_ids = [f'user{i}@example.com' for i in range(options['users'])]
+            UserProfile.objects.bulk_create(
+                [UserProfile(userId=user_id, email=user_id, userName=user_id) for user_id in user_ids]
+            )
+            seed_coupons(options['coupons'], user_ids)
+            env = self.server_env()
+
+            for server in options['servers']:
+                result = self.run_server(server, env, options)
+                self.stdout.write(
+                    f'{server:<10} {result["requests"]:>7} requests  {result["rps"]:>8.1f} req/s  '
+                    f'p50 {result["p50_ms"]:>7.1f} ms  p99 {result["p99_ms"]:>7.1f} ms  '
+                    f'errors {result["errors"]}  shutdown {result["shutdown_s"]:.1f}s'
+                )
+
+    def server_env(self):
+        """
+        Environment for server processes, pointing DB_* at the test database.
+        """
+        db = connection.settings_dict
+        env = dict(
+            os.environ,
+            DB_ENGINE=db['ENGINE'],
+            DB_NAME=str(db['NAME']),
+            DB_USER=db['USER'] or '',
+            DB_PASSWORD=db['PASSWORD'] or '',
+            DB_HOST=db['HOST'] or '',
+            DB_PORT=str(db['PORT'] or ''),
+        )
+        if REPLICA_ALIAS in settings.DATABASES:
+            env.update(
+                DB_REPLICA_NAME=env['DB_NAME'],
+                DB_REPLICA_USER=env['DB_USER'],
+                DB_REPLICA_PASSWORD=env['DB_PASSWORD'],
+                DB_REPLICA_HOST=env['DB_HOST'],
+                DB_REPLICA_PORT=env['DB_PORT'],
+            )
+        # The load is read-only and opens no sockets, so per-process rate limits
+        # and channel layers do not affect it; let several workers start without Redis
+        env['SILENCED_SYSTEM_CHECKS'] = 'Coupon.E001,Coupon.E002'
+        # The servers open their own connections
+        connection.close()
+        return env
+
+    def command(self, server, options):
+        address = f'127.0.0.1:{options["port"]}'
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        if server == 'runserver':
+            # As the old Dockerfile ran it
+            return [sys.executable, manage, 'runserver', '--noreload', address], {'DJANGO_DEBUG': 'True'}
+        return (
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')],
+            {
+                'DJANGO_DEBUG': 'False',
+                'SERVER_MODE': server,
+                'BIND': address,
+                'WEB_CONCURRENCY': str(options['workers']),
+            },
+        )
+
+    def run_server(self, server, env, options, run_load=None):
+        """
+        Start ``server``, run ``run_load(base_url)`` against it (by default the
+        PATHS mix) and stop it; returns the load result with the shutdown time.
+        """
+        args, extra_env = self.command(server, options)
+        process = subprocess.Popen(
+            args, cwd=settings.BASE_DIR, env=dict(env, **extra_env),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f'http://127.0.0.1:{options["port"]}'
+        if run_load is None:
+            def run_load(base_url):
+                return self.load(base_url, options['concurrency'], options['duration'])
+        try:
+            self.wait_until_ready(process, base_url, server)
+            result = run_load(base_url)
+        finally:
+            start = time.perf_counter()
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        result['shutdown_s'] = time.perf_counter() - start
+        return result
+
+    def wait_until_ready(self, process, base_url, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'{server} exited with status {process.returncode}')
+            try:
+                with urllib.request.urlopen(f'{base_url}/api/ready/', timeout=1):
+                    return
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                time.sleep(0.2)
+        raise CommandError(f'{server} was not ready after {timeout}s')
+
+    def load(self, base_url, concurrency, duration, paths=PATHS):
+        samples = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker(offset):
+            local_samples = []
+            local_errors = 0
+            i = offset
+            while time.monotonic() < deadline:
+                url = base_url + paths[i % len(paths)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(url, timeout=30) as response:
+                        response.read()
+                except (urllib.error.URLError, ConnectionError, TimeoutError):
+                    local_errors += 1
+                    continue
+                local_samples.append((time.perf_counter() - start) * 1000)
+            with lock:
+                samples.extend(local_samples)
+                errors[0] += local_errors
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'requests': len(samples),
+            'rps': len(samples) / elapsed,
+            'p50_ms': percentile(samples, 50),
+            'p99_ms': percentile(samples, 99),
+            'errors': errors[0],
+        }
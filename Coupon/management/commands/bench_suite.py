@@ -0,0 +1,162 @@
+import json
+import logging
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from Coupon.benchmarks import benchmark_database, seed_dataset
+from Coupon.scenarios import SCENARIOS, ScenarioContext, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and drive every API route with the browse, claim storm, '
+        'chat burst and all-routes mixes. Prints throughput and latency per route, and can '
+        'save the report as JSON and compare it with an earlier one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to seed.')
+        parser.add_argument('--coupons', type=int, default=50000, help='Number of coupons to seed.')
+        parser.add_argument('--availed-ratio', type=float, default=0.5, help='Share of seeded coupons already availed.')
+        parser.add_argument('--chats', type=int, default=2000, help='Number of two-person chats to seed.')
+        parser.add_argument('--messages-per-chat', type=int, default=20, help='Messages seeded per chat.')
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per scenario.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the data and the request mixes.')
+        parser.add_argument('--output', help='Write the report as JSON to this file.')
+        parser.add_argument('--compare', help='Compare with a report written earlier with --output.')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='Fail when any route p50 or scenario throughput is worse than the compared report by more than this percent.',
+        )
+        parser.add_argument(
+            '--rate-limits', action='store_true',
+            help='Keep RATE_LIMITS on; by default they are off so the mixes measure the views, not 429s.',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as report_file:
+                baseline = json.load(report_file)
+
+        # 4xx answers (lost claims, missing chats) are part of the mixes; keep the output readable
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        logging.getLogger('Coupon.views').setLevel(logging.WARNING)
+        logging.getLogger('Coupon.async_views').setLevel(logging.WARNING)
+
+        rate_limits = settings.RATE_LIMITS if options['rate_limits'] else {}
+        with benchmark_database(), override_settings(RATE_LIMITS=rate_limits):
+            self.stdout.write('Seeding...')
+            data = seed_dataset(
+                users=options['users'],
+                coupons=options['coupons'],
+                availed_ratio=options['availed_ratio'],
+                chats=options['chats'],
+                messages_per_chat=options['messages_per_chat'],
+                seed=options['seed'],
+            )
+            context = ScenarioContext(data)
+            vendor = connection.vendor
+
+            scenarios = {}
+            for name in options['scenarios']:
+                self.stdout.write(f'Running {name}...')
+                scenarios[name] = run_scenario(
+                    name, context, options['requests'], concurrency=options['concurrency'], seed=options['seed'],
+                )
+                self.print_scenario(name, scenarios[name])
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'database': vendor,
+                'django': django.get_version(),
+                'options': {
+                    key: options[key] for key in (
+                        'users', 'coupons', 'availed_ratio', 'chats', 'messages_per_chat',
+                        'requests', 'concurrency', 'seed', 'rate_limits',
+                    )
+                },
+            },
+            'scenarios': scenarios,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            self.stdout.write(f'Report written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = self.compare(baseline, report)
+            limit = options['max_regression']
+            if limit is not None:
+                failed = [(label, change) for label, change in regressions if change > limit]
+                if failed:
+                    raise CommandError(
+                        f'Regressions over {limit}%: ' + ', '.join(f'{label} worse by {change:.1f}%' for label, change in failed)
+                    )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_scenario(self, name, result):
+        self.stdout.write(
+            f'{name}: {result["requests"]} requests in {result["duration_s"]}s, '
+            f'{result["throughput_rps"]} req/s, {result["server_errors"]} server errors'
+        )
+        self.stdout.write(f"  {'route':<42} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+        for label, route in result['routes'].items():
+            self.stdout.write(
+                f"  {label:<42} {route['count']:>6} {route['p50_ms']:>9} {route['p95_ms']:>9} "
+                f"{route['p99_ms']:>9}  {route['statuses']}"
+            )
+
+    def compare(self, baseline, report):
+        """
+        Print changes against ``baseline`` and return [(label, percent worse)] for every comparison.
+        """
+        def change(old, new):
+            return (new - old) / old * 100 if old else 0.0
+
+        self.stdout.write(f'Compared with {baseline["meta"].get("commit")} ({baseline["meta"].get("created")}):')
+        if baseline['meta'].get('options') != report['meta']['options']:
+            self.stdout.write('  warning: the reports were made with different options')
+
+        regressions = []
+        for name, result in report['scenarios'].items():
+            old = baseline['scenarios'].get(name)
+            if old is None:
+                continue
+            # Throughput regresses when it goes down
+            rps_change = change(old['throughput_rps'], result['throughput_rps'])
+            regressions.append((f'{name} throughput', -rps_change))
+            self.stdout.write(
+                f'{name}: {old["throughput_rps"]} -> {result["throughput_rps"]} req/s ({rps_change:+.1f}%)'
+            )
+            for label, route in result['routes'].items():
+                old_route = old['routes'].get(label)
+                if old_route is None:
+                    continue
+                p50_change = change(old_route['p50_ms'], route['p50_ms'])
+                p99_change = change(old_route['p99_ms'], route['p99_ms'])
+                regressions.append((f'{name} {label} p50', p50_change))
+                self.stdout.write(
+                    f"  {label:<42} p50 {old_route['p50_ms']:>8} -> {route['p50_ms']:>8} ({p50_change:+6.1f}%)  "
+                    f"p99 {old_route['p99_ms']:>8} -> {route['p99_ms']:>8} ({p99_change:+6.1f}%)"
+                )
+        return regressions
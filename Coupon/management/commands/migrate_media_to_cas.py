@@ -0,0 +1,55 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from Coupon.images import IMAGE_FIELDS, generate_variants, release_unreferenced
+from Coupon.storage import is_addressed
+
+
+class Command(BaseCommand):
+    help = (
+        'Move existing uploads to content-addressed names, pointing every row at the '
+        'deduplicated file and deleting the old copies.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = {}  # old name -> new name, so shared files are read once
+        updated_rows = 0
+
+        for model, field_name in IMAGE_FIELDS.items():
+            rows = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list('pk', field_name)
+            )
+            for pk, name in rows.iterator():
+                if is_addressed(name):
+                    continue
+
+                if name not in moved:
+                    if not default_storage.exists(name):
+                        self.stderr.write(f'Missing file for {model.__name__} {pk}: {name}')
+                        continue
+                    if dry_run:
+                        moved[name] = name
+                    else:
+                        with default_storage.open(name, 'rb') as content:
+                            moved[name] = default_storage.save(name, content)
+                        generate_variants(moved[name])
+
+                if not dry_run:
+                    model.objects.filter(pk=pk).update(**{field_name: moved[name]})
+                updated_rows += 1
+
+        deleted = 0
+        if not dry_run:
+            for old_name in moved:
+                # save() never hands out the old names again, so no grace period is needed
+                deleted += release_unreferenced(old_name, grace=0)
+
+        self.stdout.write(
+            f'{"Would update" if dry_run else "Updated"} {updated_rows} rows '
+            f'referencing {len(moved)} files; {len(set(moved.values()))} unique files, {deleted} old files deleted'
+        )
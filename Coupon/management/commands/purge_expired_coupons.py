@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Coupon.expiry import DEFAULT_BATCH_SIZE, purge_expired_coupons
+
+
+class Command(BaseCommand):
+    help = 'Delete coupons whose validityDate has passed, in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of coupons deleted per transaction.',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and sweep every INTERVAL seconds. Runs once when omitted.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        interval = options['interval']
+
+        while True:
+            deleted = purge_expired_coupons(batch_size=batch_size)
+            self.stdout.write(f'Deleted {deleted} expired coupons')
+
+            if not interval:
+                break
+            time.sleep(interval)
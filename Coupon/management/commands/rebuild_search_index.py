@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Coupon.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the coupon search index from the database.'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend.per_process:
+            # Rebuilding here would only fill this command's own copy
+            self.stdout.write(
+                f'{type(backend).__name__} is kept in each server process, which rebuilds it every '
+                f'COUPON_SEARCH_MAX_AGE ({settings.COUPON_SEARCH_MAX_AGE}) seconds; nothing to rebuild here.'
+            )
+            return
+        backend.rebuild()
+        self.stdout.write(f'Rebuilt {type(backend).__name__} search index')
@@ -0,0 +1,39 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Coupon.tasks import Worker, task_queues
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks (image variants, image cleanup, the expired coupon sweep). '
+        'Runs until stopped with SIGTERM or SIGINT, letting running tasks finish.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queues', nargs='+',
+            help='Queues to work on (default: every queue in TASK_QUEUES).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds between checks for new tasks when idle.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no task is due instead of waiting for more.',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['queues'] or []) - set(task_queues())
+        if unknown:
+            raise CommandError(f'Unknown queues: {", ".join(sorted(unknown))}')
+
+        worker = Worker(queues=options['queues'], poll_interval=options['poll_interval'])
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        self.stdout.write(f'Worker {worker.worker_id} running {", ".join(f"{q} ({n})" for q, n in worker.limits.items())}')
+        processed = worker.run(once=options['once'])
+        self.stdout.write(f'Ran {processed} tasks')
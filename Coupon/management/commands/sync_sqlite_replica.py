@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Coupon.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary database over the SQLite replica, standing in for '
+        'replication when trying replica routing locally.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep copying every INTERVAL seconds to simulate replication lag. Copies once when omitted.',
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica configured; set DB_REPLICA_NAME.')
+
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        for database in (primary, replica):
+            if database['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('Both databases must use SQLite; real replicas are kept in sync by MySQL.')
+        if str(primary['NAME']) == str(replica['NAME']):
+            raise CommandError('DB_REPLICA_NAME must differ from DB_NAME.')
+
+        while True:
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            self.stdout.write(f'Copied {primary["NAME"]} to {replica["NAME"]}')
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
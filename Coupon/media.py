@@ -0,0 +1,144 @@
+"""
+Serving of uploaded media.
+
+Replaces django.views.static for MEDIA_URL. Responses carry strong ETags,
+Last-Modified and Cache-Control headers, answer conditional requests with 304
+and single byte ranges with 206. When MEDIA_ACCEL_REDIRECT_PREFIX or
+MEDIA_SENDFILE_HEADER is set, the front-end web server sends the file and the
+application worker only returns headers.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .storage import is_addressed
+
+# Content-addressed names never change content, so clients may keep them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+CHUNK_SIZE = 64 * 1024
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) for a single satisfiable byte range, None when the
+    header should be ignored, or False when the range cannot be satisfied.
+    """
+    match = _range_re.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    """
+    GET/HEAD: Serve the uploaded file at ``path`` below MEDIA_ROOT.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    if is_addressed(path):
+        etag = quote_etag(os.path.basename(path))
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+        cache_control = f'public, max-age={getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600)}'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    # Let the front-end web server send the file (it handles ranges itself)
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '')
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', '')
+    if accel_prefix or sendfile_header:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if accel_prefix:
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        else:
+            response[sendfile_header] = full_path
+        return response
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    if byte_range is not None:
+        start, end = byte_range
+        body = read_range(full_path, start, end) if request.method == 'GET' else []
+        response = StreamingHttpResponse(body, status=206, content_type=content_type, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['Content-Length'] = str(stat.st_size)
+        return response
+
+    # FileResponse lets the WSGI server use sendfile() through wsgi.file_wrapper
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+    return response
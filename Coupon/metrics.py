@@ -0,0 +1,278 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+MetricsMiddleware records wall time, database query count, database time and
+response size for every request, labelled with the resolved view name, into
+in-process histograms. They are exposed, together with the coupon cache
+counters, at /api/metrics/. Each server process keeps its own numbers. The
+metrics endpoints answer requests bearing METRICS_TOKEN, or, when no token
+is configured, requests from the same host only.
+
+Requests slower than METRICS_SLOW_REQUEST_SECONDS or running more than
+METRICS_SLOW_REQUEST_QUERIES queries are logged with their slowest statements,
+which is how N+1 regressions show up.
+"""
+import heapq
+import ipaddress
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils.crypto import constant_time_compare
+
+from .cache import stats as cache_stats
+from .ratelimit import client_ip
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Slowest statements kept per request for the slow request log
+SLOW_SAMPLE_SIZE = 5
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((labels, list(series)) for labels, series in self.series.items())
+        for labels, series in items:
+            base = ','.join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{base}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, labels):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + 1
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.series.items())
+        for labels, value in items:
+            base = ','.join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+            lines.append(f'{self.name}{{{base}}} {value}')
+        return lines
+
+
+VIEW_LABELS = ('view', 'method')
+
+requests_total = Counter('coupons_http_requests_total', 'Requests by view, method and status.')
+request_duration = Histogram('coupons_http_request_duration_seconds', 'Wall time per request.', LATENCY_BUCKETS)
+db_queries = Histogram('coupons_http_request_db_queries', 'Database queries per request.', QUERY_BUCKETS)
+db_duration = Histogram('coupons_http_request_db_duration_seconds', 'Database time per request.', LATENCY_BUCKETS)
+response_size = Histogram('coupons_http_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+
+
+class QueryRecorder:
+    """
+    Counts and times the queries of one request, fed by record_query().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []  # min-heap of (duration, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if len(self.slowest) < SLOW_SAMPLE_SIZE:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+    @contextmanager
+    def installed(self):
+        # Restore by value rather than token: streamed bodies may be iterated
+        # in copies of the context they started in
+        previous = _recorder.get()
+        _recorder.set(self)
+        try:
+            yield
+        finally:
+            _recorder.set(previous)
+
+
+# Recorder of the request being served. Connections are per thread, but the
+# async ORM's worker threads inherit this variable, so one hook on every
+# connection finds the right recorder in sync and async views alike.
+_recorder = ContextVar('query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_hook(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.installed():
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.installed():
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    def finish(self, request, response, recorder, start):
+        if getattr(response, 'file_to_stream', None) is not None:
+            # Wrapping the body would stop the server from sending the file with sendfile
+            self.record(request, response, recorder, time.perf_counter() - start, int(response.get('Content-Length') or 0))
+        elif response.streaming:
+            # The body, and the queries that produce it, run after this returns
+            measure = self.ameasure_stream if response.is_async else self.measure_stream
+            response.streaming_content = measure(request, response, response.streaming_content, recorder, start)
+        else:
+            self.record(request, response, recorder, time.perf_counter() - start, len(response.content))
+        return response
+
+    def measure_stream(self, request, response, content, recorder, start):
+        size = 0
+        try:
+            with recorder.installed():
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, response, recorder, time.perf_counter() - start, size)
+
+    async def ameasure_stream(self, request, response, content, recorder, start):
+        size = 0
+        try:
+            with recorder.installed():
+                async for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, response, recorder, time.perf_counter() - start, size)
+
+    def record(self, request, response, recorder, duration, size):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        labels = (view, request.method)
+
+        requests_total.inc(labels + (str(response.status_code),))
+        request_duration.observe(labels, duration)
+        db_queries.observe(labels, recorder.count)
+        db_duration.observe(labels, recorder.duration)
+        response_size.observe(labels, size)
+
+        if (duration >= getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', 1.0)
+                or recorder.count >= getattr(settings, 'METRICS_SLOW_REQUEST_QUERIES', 50)):
+            logger.warning(
+                'Slow request %s %s (%s): %.3fs, %d queries in %.3fs; slowest: %s',
+                request.method, request.path, view, duration, recorder.count, recorder.duration,
+                ' | '.join(f'{elapsed * 1000:.1f}ms {sql[:200]}' for elapsed, sql in sorted(recorder.slowest, reverse=True)),
+            )
+
+
+def render_metrics():
+    """
+    All metrics of this process in Prometheus text exposition format.
+    """
+    lines = requests_total.render(VIEW_LABELS + ('status',))
+    for histogram in (request_duration, db_queries, db_duration, response_size):
+        lines += histogram.render(VIEW_LABELS)
+
+    cache = cache_stats.as_dict()
+    for name in ('hits', 'misses', 'invalidations'):
+        lines += [
+            f'# HELP coupons_cache_{name}_total Coupon payload cache {name}.',
+            f'# TYPE coupons_cache_{name}_total counter',
+            f'coupons_cache_{name}_total {cache[name]}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_access_allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '').split()
+        return len(header) == 2 and header[0].lower() == 'bearer' and constant_time_compare(header[1], token)
+    try:
+        return ipaddress.ip_address(client_ip(request)).is_loopback
+    except ValueError:
+        return False
+
+
+def metrics_access_required(view):
+    """
+    Answer 403 to requests that may not read the metrics (see metrics_access_allowed).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not metrics_access_allowed(request):
+            return JsonResponse({'detail': 'You do not have permission to read metrics.'}, status=403)
+        return view(request, *args, **kwargs)
+
+    return wrapper
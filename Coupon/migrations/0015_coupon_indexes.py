@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Coupon', '0014_alter_coupon_userid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['isAvailed', 'category', 'validityDate'], name='coupon_avail_cat_valid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['isAvailed', 'id'], name='coupon_avail_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['validityDate'], name='coupon_validity_idx'),
+        ),
+    ]
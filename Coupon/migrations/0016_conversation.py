@@ -0,0 +1,45 @@
+# Generated by Django 5.0 on 2026-10-18 14:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+from Coupon.inbox import backfill_conversations
+
+
+def backfill(apps, schema_editor):
+    # Existing chats get their inbox rows before 0017 drops the chat_messages relation
+    backfill_conversations(
+        apps.get_model('Coupon', 'ChatMessage'),
+        apps.get_model('Coupon', 'Conversation'),
+        using=schema_editor.connection.alias,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Coupon', '0015_coupon_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Coupon.chatmessage')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='Coupon.userprofile')),
+                ('peer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Coupon.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-last_timestamp'], name='conversation_inbox_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('owner', 'peer'), name='conversation_owner_peer_uniq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Coupon', '0016_conversation'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='chat_messages',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['sender', 'receiver', 'id'], name='chatmessage_pair_id_idx'),
+        ),
+    ]
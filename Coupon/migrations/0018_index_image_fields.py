@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Coupon', '0017_retire_userprofile_chat_messages'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='chat_images/'),
+        ),
+        migrations.AlterField(
+            model_name='coupon',
+            name='screenshots',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='coupon_screenshots/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='userImage',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='users_profile_images/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Coupon', '0019_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='uploadBatch',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+        ),
+    ]
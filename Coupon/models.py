@@ -1,4 +1,6 @@
-from django.db import models
+from datetime import date
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -7,9 +9,33 @@ class ChatMessage(models.Model):
     sender = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='sender')
     receiver = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='receiver')
     content = models.TextField()
-    image = models.ImageField(upload_to='chat_images/', null=True, blank=True)
+    image = models.ImageField(upload_to='chat_images/', null=True, blank=True, db_index=True)
     timestamp = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # Chat history windows: one range per direction of the chat, keyed by id
+            models.Index(fields=['sender', 'receiver', 'id'], name='chatmessage_pair_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep both participants' inbox rows in step with every new message
+        created = self._state.adding
+        with transaction.atomic():
+            super(ChatMessage, self).save(*args, **kwargs)
+            if created:
+                Conversation.record(self)
+
+
+class CouponQuerySet(models.QuerySet):
+    def active(self, today=None):
+        # Coupons that are still valid today; read paths use this so they stay
+        # correct between expiry sweeps without deleting anything themselves
+        return self.filter(validityDate__gte=today or date.today())
+
+    def expired(self, today=None):
+        return self.filter(validityDate__lt=today or date.today())
+
 
 class Coupon(models.Model):
     id = models.AutoField(primary_key=True)
@@ -21,7 +47,22 @@ class Coupon(models.Model):
     validityDate = models.DateField()
     directUpload = models.BooleanField(default=True)
     couponCode = models.CharField(max_length=255)
-    screenshots = models.ImageField(upload_to='coupon_screenshots/', null=True, blank=True)
+    screenshots = models.ImageField(upload_to='coupon_screenshots/', null=True, blank=True, db_index=True)
+    # Marks the rows of one bulk upload batch, so their ids can be read back
+    # on databases where bulk_create cannot return them (MySQL)
+    uploadBatch = models.CharField(max_length=32, null=True, blank=True, editable=False, db_index=True)
+
+    objects = CouponQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # coupon_list_create: isAvailed=False [, category=...] and validityDate >= today
+            models.Index(fields=['isAvailed', 'category', 'validityDate'], name='coupon_avail_cat_valid_idx'),
+            # latest_coupons: isAvailed=False ordered by -id
+            models.Index(fields=['isAvailed', 'id'], name='coupon_avail_id_idx'),
+            # purge_expired_coupons: validityDate < today
+            models.Index(fields=['validityDate'], name='coupon_validity_idx'),
+        ]
 
 
 class UserProfile(models.Model):
@@ -29,10 +70,9 @@ class UserProfile(models.Model):
     userName = models.CharField(max_length=255)
     email = models.CharField(max_length=255, default='')
     password = models.CharField(max_length=255,  default='')
-    userImage = models.ImageField(upload_to='users_profile_images/', null=True, blank=True)
+    userImage = models.ImageField(upload_to='users_profile_images/', null=True, blank=True, db_index=True)
     availedCoupons = models.ManyToManyField('Coupon', related_name='availed_coupons', blank=True)
     uploadedCoupons = models.ManyToManyField('Coupon', related_name='uploaded_coupons', blank=True)
-    chat_messages = models.ManyToManyField('ChatMessage', related_name='chat_messages', blank=True)
 
     def save(self, *args, **kwargs):
         # Set userId to the email value if it's not already set
@@ -40,5 +80,114 @@ class UserProfile(models.Model):
             self.userId = self.email
         super(UserProfile, self).save(*args, **kwargs)
 
+    @property
+    def chat_messages(self):
+        # Messages are reached through their sender/receiver foreign keys
+        return ChatMessage.objects.filter(models.Q(sender=self) | models.Q(receiver=self))
+
+    def __str__(self):
+        return self.userName
+
+
+class Conversation(models.Model):
+    """
+    Inbox entry of ``owner`` for their chat with ``peer``.
+
+    Each chat has one row per participant, updated in the same transaction
+    as every new message, so an inbox is one indexed range scan on owner.
+    """
+    owner = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='conversations')
+    peer = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey('ChatMessage', on_delete=models.SET_NULL, null=True, related_name='+')
+    last_timestamp = models.DateTimeField(default=timezone.now)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'peer'], name='conversation_owner_peer_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-last_timestamp'], name='conversation_inbox_idx'),
+        ]
+
+    @classmethod
+    def record(cls, message):
+        """
+        Point both participants' rows at ``message`` and count it as unread for the receiver.
+        """
+        sender_id, receiver_id = message.sender_id, message.receiver_id
+        pairs = {(sender_id, receiver_id), (receiver_id, sender_id)}
+
+        # One UPDATE covers both rows once the chat exists
+        chat = models.Q(owner_id=sender_id, peer_id=receiver_id) | models.Q(owner_id=receiver_id, peer_id=sender_id)
+        if cls._apply(message, chat) == len(pairs):
+            return
+
+        # First message of the chat: create the rows that are missing. The rows
+        # updated above point at the message and stay locked until commit.
+        updated = set(cls.objects.filter(chat, last_message=message).values_list('owner_id', 'peer_id'))
+        for owner_id, peer_id in pairs - updated:
+            try:
+                with transaction.atomic():
+                    created = cls.objects.get_or_create(owner_id=owner_id, peer_id=peer_id, defaults={
+                        'last_message': message,
+                        'last_timestamp': message.timestamp,
+                        'unread_count': int(owner_id == receiver_id != sender_id),
+                    })[1]
+            except IntegrityError:
+                created = False
+            if not created:
+                # Created concurrently by another message of the same chat
+                cls._apply(message, models.Q(owner_id=owner_id, peer_id=peer_id))
+
+    @classmethod
+    def _apply(cls, message, rows):
+        receiver_id = message.receiver_id
+        return cls.objects.filter(rows).update(
+            last_message=message,
+            last_timestamp=message.timestamp,
+            unread_count=models.F('unread_count') + models.Case(
+                models.When(models.Q(owner_id=receiver_id) & ~models.Q(peer_id=receiver_id), then=models.Value(1)),
+                default=models.Value(0),
+            ),
+        )
+
+
+class Task(models.Model):
+    """
+    A queued call of a function registered with @tasks.task.
+
+    Workers (manage.py run_tasks) claim due rows by flipping them from queued
+    to running. Successful tasks are deleted, or rescheduled when periodic;
+    tasks that run out of attempts stay behind as failed for inspection.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=255)
+    queue = models.CharField(max_length=64, default='default')
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Optional deduplication key: only one unfinished task per key
+    key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Claiming: due tasks of a queue, oldest first
+            models.Index(fields=['status', 'queue', 'run_at'], name='task_claim_idx'),
+            # Reclaiming tasks of workers that died mid-run
+            models.Index(fields=['status', 'locked_at'], name='task_stale_idx'),
+        ]
+
     def __str__(self):
-        return self.userName
\ No newline at end of file
+        return f'{self.name} ({self.status})'
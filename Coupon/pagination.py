@@ -0,0 +1,61 @@
+from rest_framework.pagination import CursorPagination
+
+# Default and maximum number of messages in a chat history window
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
+
+class CouponCursorPagination(CursorPagination):
+    """
+    Keyset pagination on coupon id, newest first.
+
+    Pages are addressed by an opaque ``cursor`` that encodes the last id seen,
+    so fetching a deep page costs the same indexed range scan as the first one.
+    Clients pick a page size with ``limit``, capped at ``max_page_size``.
+    """
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        paginate_queryset() for async views: the same cursors and links, with
+        the page fetched through the async ORM. ``request`` is a DRF Request.
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, None)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        # Ordering is on the unique id, so the position alone marks the page
+        if reverse:
+            queryset = queryset.order_by('id')
+        else:
+            queryset = queryset.order_by('-id')
+        if current_position is not None:
+            queryset = queryset.filter(id__gt=current_position) if reverse else queryset.filter(id__lt=current_position)
+
+        # Fetch one extra row to know whether another page follows
+        results = [row async for row in queryset[offset:offset + self.page_size + 1]]
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+        following_position = results[-1].id if has_following_position else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+        return self.page
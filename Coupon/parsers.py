@@ -0,0 +1,36 @@
+import codecs
+import csv
+import shutil
+import tempfile
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+# Uploads larger than this are spooled to a temporary file instead of memory
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class CSVParser(BaseParser):
+    """
+    Parse a text/csv body into an iterator of row dicts keyed by the header row.
+
+    The body is copied to a spooled temporary file, so large uploads are read
+    row by row without holding them in memory.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        if stream is not None:
+            shutil.copyfileobj(stream, spool)
+        spool.seek(0)
+        return read_csv(spool)
+
+
+def read_csv(binary_file):
+    rows = csv.DictReader(codecs.iterdecode(binary_file, 'utf-8-sig'))
+    try:
+        for row in rows:
+            yield row
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ParseError(f'Invalid CSV: {e}')
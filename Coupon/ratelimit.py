@@ -0,0 +1,191 @@
+"""
+Token-bucket rate limiting for abuse-prone routes.
+
+RATE_LIMITS maps URL names to per-user and per-IP rates such as "20/minute":
+a bucket holds up to 20 tokens, refills at 20 per minute and each request
+takes one. RateLimitMiddleware checks the buckets in process_view, after URL
+resolution but before the view runs, so rejected requests cost no database
+work and get a 429 with Retry-After.
+
+Per-user buckets are keyed on the owner of a verified bearer token (checked
+without a database query), never on a user named in the URL or body, so
+nobody can drain someone else's bucket. The write routes with a per-user
+limit refuse requests without a valid token, so those only draw from the IP
+bucket on their way to a 401. Buckets live in the backend named by RATE_LIMIT_BACKEND:
+MemoryBackend keeps them per process; CacheBackend keeps them in the
+RATE_LIMIT_CACHE cache so several server processes share them.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from .authentication import request_user_id
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    Turn "N/period" into (capacity, tokens per second).
+    """
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period]
+
+
+def take_token(state, capacity, refill_rate, now):
+    """
+    Apply one request to a bucket ``state`` of (tokens, updated). Returns the
+    new state and the seconds to wait, 0 when the request is allowed.
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class RateLimitBackend:
+    def consume(self, key, capacity, refill_rate):
+        """
+        Take a token from bucket ``key``; return the seconds to wait, 0 when allowed.
+        """
+        raise NotImplementedError
+
+    async def aconsume(self, key, capacity, refill_rate):
+        # Shared stores do network I/O; keep it off the event loop
+        return await sync_to_async(self.consume, thread_sensitive=False)(key, capacity, refill_rate)
+
+
+class MemoryBackend(RateLimitBackend):
+    """
+    Buckets in this process, least recently used ones dropped beyond MAX_KEYS.
+    """
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def consume(self, key, capacity, refill_rate):
+        now = time.monotonic()
+        with self.lock:
+            state, wait = take_token(self.buckets.get(key), capacity, refill_rate, now)
+            self.buckets[key] = state
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > self.MAX_KEYS:
+                self.buckets.popitem(last=False)
+        return wait
+
+    async def aconsume(self, key, capacity, refill_rate):
+        # Never blocks for long, so run it on the event loop
+        return self.consume(key, capacity, refill_rate)
+
+
+class CacheBackend(RateLimitBackend):
+    """
+    Buckets in a shared cache (RATE_LIMIT_CACHE), e.g. Redis, so every server
+    process sees the same counts. The read and write are not atomic, so a few
+    requests racing on one bucket may all get through; fine for throttling abuse.
+    """
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+    def consume(self, key, capacity, refill_rate):
+        cache_key = f'ratelimit:{key}'
+        state, wait = take_token(self.cache.get(cache_key), capacity, refill_rate, time.time())
+        # Keep the bucket until it would have refilled completely
+        self.cache.set(cache_key, state, timeout=math.ceil(capacity / refill_rate) + 1)
+        return wait
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Return the process-wide rate limit backend configured by RATE_LIMIT_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'RATE_LIMIT_BACKEND', 'Coupon.ratelimit.MemoryBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def client_ip(request):
+    # Behind RATE_LIMIT_PROXY_COUNT reverse proxies the client is that many hops from the right
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(wait):
+    response = JsonResponse({'detail': 'Too many requests.'}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django runs a sync process_view in a thread for async requests
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def buckets(self, request):
+        """
+        The (key, rate) buckets this request draws from; empty when the route is not limited.
+        """
+        match = request.resolver_match
+        limits = getattr(settings, 'RATE_LIMITS', {}).get(match.url_name if match else None)
+        if not limits or request.method not in limits.get('methods', ('POST',)):
+            return []
+
+        buckets = []
+        if 'ip' in limits:
+            buckets.append((f'{match.url_name}:ip:{client_ip(request)}', limits['ip']))
+        if 'user' in limits:
+            user_id = request_user_id(request)
+            if user_id:
+                buckets.append((f'{match.url_name}:user:{user_id}', limits['user']))
+        return buckets
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        backend = get_backend()
+        for key, rate in self.buckets(request):
+            wait = backend.consume(key, *parse_rate(rate))
+            if wait:
+                return too_many_requests(wait)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        backend = get_backend()
+        for key, rate in self.buckets(request):
+            wait = await backend.aconsume(key, *parse_rate(rate))
+            if wait:
+                return too_many_requests(wait)
+        return None
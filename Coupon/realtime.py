@@ -0,0 +1,31 @@
+"""
+Push delivery of chat messages to connected WebSocket clients.
+
+Every user has a channel-layer group that their open sockets join (see
+consumers.py). New messages are published to the sender's and the receiver's
+groups once the insert is committed.
+"""
+import hashlib
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .serializers import ChatMessageSerializer
+
+
+def chat_group_name(user_id):
+    # Group names only allow ASCII letters, digits, hyphens and periods; user ids are emails
+    return 'chat.' + hashlib.sha1(user_id.encode()).hexdigest()
+
+
+def publish_chat_message(message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    event = {
+        'type': 'chat.message',
+        'message': ChatMessageSerializer(message).data,
+    }
+    for user_id in {message.sender_id, message.receiver_id}:
+        async_to_sync(channel_layer.group_send)(chat_group_name(user_id), event)
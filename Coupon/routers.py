@@ -0,0 +1,136 @@
+"""
+Read-replica routing.
+
+Writes always go to the primary ("default"). Reads go to the "replica"
+database only inside views decorated with @read_from_replica, and only for
+safe methods. After a client writes something, ReplicaPinningMiddleware sets a
+short-lived cookie that keeps that client's reads on the primary, so it sees
+its own changes even while the replica lags behind. The cookie is
+SameSite=None so the frontends' cross-site requests carry it too.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def reading_from_replica():
+    return _read_alias.get() == REPLICA_ALIAS
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the ORM reads in this block to the primary, even inside a @read_from_replica view.
+    """
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def read_from_replica(view):
+    """
+    Send the ORM reads of ``view`` to the replica unless the client was pinned
+    to the primary by a recent write.
+    """
+    def use_replica(request):
+        return request.method in SAFE_METHODS and not is_pinned(request) and replica_configured()
+
+    if iscoroutinefunction(view):
+        # The async ORM runs queries in threads that inherit this context variable
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not use_replica(request):
+                return await view(request, *args, **kwargs)
+
+            token = _read_alias.set(REPLICA_ALIAS)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not use_replica(request):
+            return view(request, *args, **kwargs)
+
+        token = _read_alias.set(REPLICA_ALIAS)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Database cache tables, such as the coupon cache generation, must not lag behind writes
+        if model._meta.app_label == 'django_cache':
+            return None
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema through replication
+        return db != REPLICA_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin a client to the primary for REPLICA_PIN_SECONDS after any successful write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True,
+                # Sent with the credentialed cross-site requests of CORS_ALLOWED_ORIGINS
+                samesite='None',
+                secure=True,
+            )
+        return response
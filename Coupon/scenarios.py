@@ -0,0 +1,394 @@
+"""
+Request mixes driven by the bench_suite management command.
+
+Each operation picks its parameters from the seeded data, does any untimed
+setup, and returns (route label, request) where ``request`` is a callable the
+runner times. Scenarios are weighted mixes of operations; "all_routes" cycles
+through one operation per route and method in Coupon/urls.py.
+"""
+import itertools
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import Client
+
+from .authentication import issue_tokens
+from .benchmarks import CATEGORIES, COMPANIES, percentile
+from .models import Coupon, UserProfile
+
+
+class ScenarioContext:
+    """
+    Seeded data shared by the client threads, plus state built up while running.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.lock = threading.Lock()
+        self.claimed = {}  # coupon id -> user id, for releases
+        self.sequence = itertools.count()
+
+    def next_id(self):
+        with self.lock:
+            return next(self.sequence)
+
+
+def consume(response):
+    # Streaming bodies are produced while they are read, so read them inside the timing
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def coupon_payload(rng, user_id, suffix):
+    return {
+        'userId': user_id,
+        'companyName': rng.choice(COMPANIES),
+        'description': f'Benchmark coupon {suffix}',
+        'category': rng.choice(CATEGORIES),
+        'validityDate': (date.today() + timedelta(days=30)).isoformat(),
+        'couponCode': f'BENCH{suffix}',
+    }
+
+
+def create_coupon(rng, user_id, suffix):
+    coupon = Coupon.objects.create(**coupon_payload(rng, user_id, suffix))
+    UserProfile.uploadedCoupons.through.objects.create(userprofile_id=user_id, coupon_id=coupon.id)
+    return coupon
+
+
+# Operations: (client, rng, context) -> (label, callable)
+
+def list_coupons(client, rng, context):
+    user_id = rng.choice(context.data['user_ids'])
+    params = {'category': rng.choice(CATEGORIES), 'userId': user_id} if rng.random() < 0.7 else {}
+    return 'GET coupons/', lambda: client.get('/api/coupons/', params)
+
+
+def create_coupon_api(client, rng, context):
+    payload = coupon_payload(rng, rng.choice(context.data['user_ids']), f'api{context.next_id()}')
+    return 'POST coupons/', lambda: client.post('/api/coupons/', payload, content_type='application/json')
+
+
+def coupon_detail(client, rng, context):
+    coupon_id = rng.choice(context.data['coupon_ids'])
+    return 'GET coupons/<id>/', lambda: client.get(f'/api/coupons/{coupon_id}/')
+
+
+def update_coupon(client, rng, context):
+    user_id = rng.choice(context.data['user_ids'])
+    suffix = f'put{context.next_id()}'
+    coupon = create_coupon(rng, user_id, suffix)
+    payload = dict(coupon_payload(rng, user_id, suffix), description='Updated benchmark coupon')
+    return 'PUT coupons/<id>/', lambda: client.put(
+        f'/api/coupons/{coupon.id}/', payload, content_type='application/json'
+    )
+
+
+def delete_coupon(client, rng, context):
+    coupon = create_coupon(rng, rng.choice(context.data['user_ids']), f'del{context.next_id()}')
+    return 'DELETE coupons/<id>/', lambda: client.delete(f'/api/coupons/{coupon.id}/')
+
+
+def latest_coupons(client, rng, context):
+    params = {'limit': 20}
+    if rng.random() < 0.5:
+        params['userId'] = rng.choice(context.data['user_ids'])
+    return 'GET coupons/latest/', lambda: client.get('/api/coupons/latest/', params)
+
+
+def search_coupons(client, rng, context):
+    company = rng.choice(COMPANIES).lower()
+    # Prefixes and the odd typo, as typed into a search box
+    query = company[:rng.randint(3, len(company))]
+    if rng.random() < 0.2:
+        query = company[:-2] + company[-1]
+    return 'GET coupons/search/', lambda: client.get('/api/coupons/search/', {'q': query, 'limit': 20})
+
+
+def bulk_upload(client, rng, context):
+    user_id = rng.choice(context.data['user_ids'])
+    batch = context.next_id()
+    rows = [coupon_payload(rng, user_id, f'bulk{batch}x{i}') for i in range(20)]
+    return 'POST coupons/bulk/', lambda: client.post('/api/coupons/bulk/', rows, content_type='application/json')
+
+
+def bearer(user_id):
+    return f'Bearer {issue_tokens(UserProfile(userId=user_id))["access"]}'
+
+
+def export_coupons(client, rng, context):
+    category = rng.choice(CATEGORIES)
+    auth = bearer(rng.choice(context.data['user_ids']))
+    return 'GET coupons/export/', lambda: consume(
+        client.get('/api/coupons/export/', {'category': category}, HTTP_AUTHORIZATION=auth)
+    )
+
+
+def list_users(client, rng, context):
+    return 'GET user-profiles/', lambda: client.get('/api/user-profiles/')
+
+
+def create_user(client, rng, context):
+    email = f'new{context.next_id()}@example.com'
+    payload = {'email': email, 'userName': 'New user', 'password': context.data['password']}
+    return 'POST user-profiles/', lambda: client.post('/api/user-profiles/', payload, content_type='application/json')
+
+
+def login(client, rng, context):
+    payload = {'email': rng.choice(context.data['user_ids']), 'password': context.data['password']}
+    return 'POST user-profile/login/', lambda: client.post(
+        '/api/user-profile/login/', payload, content_type='application/json'
+    )
+
+
+def refresh_token(client, rng, context):
+    tokens = issue_tokens(UserProfile.objects.get(userId=rng.choice(context.data['user_ids'])))
+    return 'POST user-profile/token/refresh/', lambda: client.post(
+        '/api/user-profile/token/refresh/', {'refresh': tokens['refresh']}, content_type='application/json'
+    )
+
+
+def current_user(client, rng, context):
+    # Profile reloads of a logged in user: token checks instead of password hashes
+    auth = bearer(rng.choice(context.data['user_ids']))
+    return 'GET user-profile/me/', lambda: client.get(
+        '/api/user-profile/me/', {'expand': 'uploadedCoupons'}, HTTP_AUTHORIZATION=auth
+    )
+
+
+def export_user(client, rng, context):
+    email = rng.choice(context.data['user_ids'])
+    auth = bearer(email)
+    return 'GET user-profile/<email>/export/', lambda: consume(
+        client.get(f'/api/user-profile/{email}/export/', HTTP_AUTHORIZATION=auth)
+    )
+
+
+def user_profile(client, rng, context):
+    email = rng.choice(context.data['user_ids'])
+    params = {'expand': 'uploadedCoupons'} if rng.random() < 0.5 else {}
+    return 'GET user-profile/<email>/', lambda: client.get(f'/api/user-profile/{email}/', params)
+
+
+def update_user(client, rng, context):
+    email = rng.choice(context.data['user_ids'])
+    payload = {'email': email, 'userName': f'Renamed {context.next_id()}'}
+    return 'PATCH user-profile/<email>/', lambda: client.patch(
+        f'/api/user-profile/{email}/', payload, content_type='application/json'
+    )
+
+
+def delete_user(client, rng, context):
+    email = f'gone{context.next_id()}@example.com'
+    UserProfile.objects.create(userId=email, email=email, userName='Leaving user')
+    return 'DELETE user-profile/<email>/', lambda: client.delete(f'/api/user-profile/{email}/')
+
+
+def chat_inbox(client, rng, context):
+    user_id = rng.choice(context.data['chat_pairs'])[0] if context.data['chat_pairs'] else rng.choice(context.data['user_ids'])
+    return 'GET chat/messages/<user>/', lambda: client.get(f'/api/chat/messages/{user_id}/')
+
+
+def chat_pair(rng, context):
+    if context.data['chat_pairs']:
+        first, second = rng.choice(context.data['chat_pairs'])
+    else:
+        first, second = rng.sample(context.data['user_ids'], 2)
+    return (first, second) if rng.random() < 0.5 else (second, first)
+
+
+def chat_history(client, rng, context):
+    user_id, other_id = chat_pair(rng, context)
+    return 'GET chat/messages/<user>/<other>/', lambda: client.get(
+        f'/api/chat/messages/{user_id}/{other_id}/', {'limit': 50}
+    )
+
+
+def send_message(client, rng, context):
+    user_id, other_id = chat_pair(rng, context)
+    payload = {'content': f'Benchmark message {context.next_id()}'}
+    auth = bearer(user_id)
+    return 'POST chat/messages/<user>/<other>/', lambda: client.post(
+        f'/api/chat/messages/{user_id}/{other_id}/', payload, content_type='application/json', HTTP_AUTHORIZATION=auth
+    )
+
+
+def mark_read(client, rng, context):
+    user_id, other_id = chat_pair(rng, context)
+    return 'POST chat/messages/<user>/<other>/read/', lambda: client.post(
+        f'/api/chat/messages/{user_id}/{other_id}/read/'
+    )
+
+
+def claim_coupon(client, rng, context):
+    # Claim storms: many users race for a small set of hot coupons
+    hot = context.data['open_coupon_ids'][:50] or context.data['coupon_ids']
+    coupon_id = rng.choice(hot)
+    user_id = rng.choice(context.data['user_ids'])
+    auth = bearer(user_id)
+
+    def request():
+        response = client.post(f'/api/coupons/{coupon_id}/avail/{user_id}/', HTTP_AUTHORIZATION=auth)
+        if response.status_code == 201:
+            with context.lock:
+                context.claimed[coupon_id] = user_id
+        return response
+
+    return 'POST coupons/<id>/avail/<user>/', request
+
+
+def release_coupon(client, rng, context):
+    with context.lock:
+        coupon_id, user_id = context.claimed.popitem() if context.claimed else (
+            rng.choice(context.data['coupon_ids']), rng.choice(context.data['user_ids'])
+        )
+    auth = bearer(user_id)
+    return 'POST coupons/<id>/disavail/<user>/', lambda: client.post(
+        f'/api/coupons/{coupon_id}/disavail/{user_id}/', HTTP_AUTHORIZATION=auth
+    )
+
+
+def async_list_coupons(client, rng, context):
+    params = {'category': rng.choice(CATEGORIES), 'userId': rng.choice(context.data['user_ids'])}
+    return 'GET async/coupons/', lambda: client.get('/api/async/coupons/', params)
+
+
+def async_create_coupon(client, rng, context):
+    payload = coupon_payload(rng, rng.choice(context.data['user_ids']), f'async{context.next_id()}')
+    return 'POST async/coupons/', lambda: client.post('/api/async/coupons/', payload, content_type='application/json')
+
+
+def async_latest_coupons(client, rng, context):
+    params = {'limit': 20, 'userId': rng.choice(context.data['user_ids'])}
+    return 'GET async/coupons/latest/', lambda: client.get('/api/async/coupons/latest/', params)
+
+
+def async_chat_history(client, rng, context):
+    user_id, other_id = chat_pair(rng, context)
+    return 'GET async/chat/messages/<user>/<other>/', lambda: client.get(
+        f'/api/async/chat/messages/{user_id}/{other_id}/', {'limit': 50}
+    )
+
+
+def async_send_message(client, rng, context):
+    user_id, other_id = chat_pair(rng, context)
+    payload = {'content': f'Benchmark message {context.next_id()}'}
+    auth = bearer(user_id)
+    return 'POST async/chat/messages/<user>/<other>/', lambda: client.post(
+        f'/api/async/chat/messages/{user_id}/{other_id}/', payload, content_type='application/json',
+        HTTP_AUTHORIZATION=auth,
+    )
+
+
+def metrics(client, rng, context):
+    return 'GET metrics/', lambda: client.get('/api/metrics/')
+
+
+def cache_metrics(client, rng, context):
+    return 'GET metrics/cache/', lambda: client.get('/api/metrics/cache/')
+
+
+def health(client, rng, context):
+    return 'GET health/', lambda: client.get('/api/health/')
+
+
+def readiness(client, rng, context):
+    return 'GET ready/', lambda: client.get('/api/ready/')
+
+
+ALL_ROUTES = [
+    list_coupons, create_coupon_api, coupon_detail, update_coupon, delete_coupon, latest_coupons,
+    search_coupons, bulk_upload, export_coupons, list_users, create_user, login, refresh_token,
+    current_user, export_user, user_profile, update_user, delete_user, chat_inbox, chat_history,
+    send_message, mark_read, claim_coupon, release_coupon, async_list_coupons, async_create_coupon,
+    async_latest_coupons, async_chat_history, async_send_message, metrics, cache_metrics, health, readiness,
+]
+
+# Scenario name -> [(weight, operation)], or a plain list of operations run in turn
+SCENARIOS = {
+    'browse': [
+        (25, latest_coupons), (20, list_coupons), (15, search_coupons), (15, coupon_detail),
+        (8, user_profile), (5, current_user), (5, chat_inbox), (5, chat_history), (2, list_users), (1, login),
+        (1, export_coupons), (2, health),
+    ],
+    'claim_storm': [
+        (70, claim_coupon), (10, release_coupon), (15, latest_coupons), (5, coupon_detail),
+    ],
+    'chat_burst': [
+        (45, send_message), (25, chat_history), (15, chat_inbox), (10, mark_read), (5, user_profile),
+    ],
+    'all_routes': ALL_ROUTES,
+}
+
+
+def run_scenario(name, context, requests, concurrency=1, seed=0):
+    """
+    Send ``requests`` requests of scenario ``name`` from ``concurrency`` threads
+    and return throughput, per-route latency percentiles and status counts.
+    """
+    mix = SCENARIOS[name]
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    results_lock = threading.Lock()
+
+    def worker(index, count):
+        rng = random.Random(f'{seed}-{name}-{index}')
+        client = Client(raise_request_exception=False)
+        if isinstance(mix[0], tuple):
+            weights = [weight for weight, _ in mix]
+            operations = (rng.choices([op for _, op in mix], weights)[0] for _ in range(count))
+        else:
+            operations = itertools.islice(itertools.cycle(mix[index % len(mix):] + mix[:index % len(mix)]), count)
+
+        local_samples = defaultdict(list)
+        local_statuses = defaultdict(Counter)
+        try:
+            for operation in operations:
+                label, request = operation(client, rng, context)
+                start = time.perf_counter()
+                response = request()
+                local_samples[label].append((time.perf_counter() - start) * 1000)
+                local_statuses[label][response.status_code] += 1
+        finally:
+            connection.close()
+            with results_lock:
+                for label, values in local_samples.items():
+                    samples[label].extend(values)
+                    statuses[label].update(local_statuses[label])
+
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(i, count)) for i, count in enumerate(per_thread)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for label in sorted(samples):
+        values = samples[label]
+        routes[label] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 50), 3),
+            'p95_ms': round(percentile(values, 95), 3),
+            'p99_ms': round(percentile(values, 99), 3),
+            'mean_ms': round(sum(values) / len(values), 3),
+            'statuses': {str(code): count for code, count in sorted(statuses[label].items())},
+        }
+
+    total = sum(route['count'] for route in routes.values())
+    return {
+        'requests': total,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'server_errors': sum(
+            count for label in statuses for code, count in statuses[label].items() if code >= 500
+        ),
+        'routes': routes,
+    }
@@ -0,0 +1,398 @@
+"""
+Coupon search.
+
+Coupons are indexed on companyName, category and description by a pluggable
+backend chosen with the COUPON_SEARCH_BACKEND setting. Backends are kept up to
+date by the Coupon save/delete signals in signals.py and answer ranked queries
+with prefix and typo-tolerant matching. Only open coupons (not availed, not
+expired) are indexed: update_index() drops a coupon when it is claimed and
+puts it back when it is released, and expired ones go when the expiry sweep
+deletes them or the index is rebuilt. Searches can be restricted further to
+the rows of a queryset before results are cut to the limit.
+"""
+import bisect
+import difflib
+import heapq
+import math
+import re
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.module_loading import import_string
+
+from .models import Coupon
+
+# Relative weight of a match in each indexed field
+FIELD_WEIGHTS = {
+    'companyName': 3.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+# Maximum number of ids a search returns
+MAX_RESULTS = 1000
+
+# Score multipliers for matches that are not exact
+PREFIX_PENALTY = 0.8
+TYPO_PENALTY = 0.5
+
+_token_re = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _token_re.findall((text or '').lower())
+
+
+def close_terms(term, candidates, n=3):
+    """
+    Return up to ``n`` vocabulary terms within a small edit distance of ``term``.
+    """
+    candidates = [c for c in candidates if abs(len(c) - len(term)) <= 2]
+    return difflib.get_close_matches(term, candidates, n=n, cutoff=0.75)
+
+
+def searchable_coupons():
+    return Coupon.objects.active().filter(isAvailed=False)
+
+
+def is_searchable(coupon):
+    return not coupon.isAvailed and coupon.validityDate >= date.today()
+
+
+class SearchBackend:
+    """
+    Interface implemented by every search backend.
+    """
+    # Whether each process holds its own copy of the index
+    per_process = False
+
+    def index(self, coupon):
+        raise NotImplementedError
+
+    def remove(self, coupon_id):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, limit=MAX_RESULTS, queryset=None):
+        """
+        Return coupon ids matching ``query``, best match first, keeping only
+        ids in ``queryset`` when it is given.
+        """
+        raise NotImplementedError
+
+    def warm(self):
+        """
+        Load whatever the first search would otherwise have to wait for.
+        """
+
+
+class InvertedIndexBackend(SearchBackend):
+    """
+    In-process inverted index, built from the database on first use.
+
+    Writes made by this process are applied immediately through signals.
+    Other processes see them once their copy is older than
+    COUPON_SEARCH_MAX_AGE seconds and gets rebuilt. Only one thread builds at
+    a time; once a copy exists, rebuilds run in a background thread while
+    searches keep using the old one.
+    """
+    per_process = True
+
+    # Ranked ids checked against the queryset per query
+    FILTER_CHUNK_SIZE = 500
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.max_age = getattr(settings, 'COUPON_SEARCH_MAX_AGE', 300)
+        self.built_at = None
+        self.postings = {}  # term -> {coupon id: weight}
+        self.documents = {}  # coupon id -> terms indexed for it
+        self.vocabulary = []  # sorted terms, for prefix lookups
+        self.vocabulary_dirty = False
+        self.pending = None  # coupon id -> coupon (None when removed) changed during a rebuild
+
+    def ensure_built(self):
+        if self.built_at is None:
+            # Nothing to serve yet: wait for the one thread that builds it
+            with self.build_lock:
+                if self.built_at is None:
+                    self._rebuild()
+        elif time.monotonic() - self.built_at > self.max_age and self.build_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh, name='search-index-rebuild', daemon=True).start()
+
+    def warm(self):
+        threading.Thread(target=self._warm, name='search-index-build', daemon=True).start()
+
+    def _warm(self):
+        try:
+            self.ensure_built()
+        finally:
+            connections.close_all()
+
+    def _refresh(self):
+        # Runs in its own thread with build_lock held by the thread that started it
+        try:
+            self._rebuild()
+        finally:
+            self.build_lock.release()
+            connections.close_all()
+
+    def rebuild(self):
+        with self.build_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self.lock:
+            self.pending = {}
+        try:
+            postings = {}
+            documents = {}
+            rows = searchable_coupons().values_list('id', 'companyName', 'category', 'description')
+            for row in rows.iterator(chunk_size=2000):
+                documents[row[0]] = self._add(postings, row[0], dict(zip(FIELD_WEIGHTS, row[1:])))
+
+            with self.lock:
+                self.postings = postings
+                self.documents = documents
+                # Writes committed while the rows were read may be missing from them
+                for coupon_id, coupon in self.pending.items():
+                    self._remove(coupon_id)
+                    if coupon is not None:
+                        self._index(coupon)
+                self.vocabulary = sorted(postings)
+                self.vocabulary_dirty = False
+                self.built_at = time.monotonic()
+        finally:
+            with self.lock:
+                self.pending = None
+
+    def _add(self, postings, coupon_id, fields):
+        terms = set()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(fields[field]):
+                entry = postings.setdefault(term, {})
+                entry[coupon_id] = entry.get(coupon_id, 0) + weight
+                terms.add(term)
+        return terms
+
+    def index(self, coupon):
+        with self.lock:
+            if self.pending is not None:
+                self.pending[coupon.id] = coupon
+            if self.built_at is None:
+                # Nothing loaded yet; the first search reads this coupon from the database
+                return
+            self._remove(coupon.id)
+            self._index(coupon)
+
+    def _index(self, coupon):
+        self.documents[coupon.id] = self._add(self.postings, coupon.id, {
+            'companyName': coupon.companyName,
+            'category': coupon.category,
+            'description': coupon.description,
+        })
+        self.vocabulary_dirty = True
+
+    def remove(self, coupon_id):
+        with self.lock:
+            if self.pending is not None:
+                self.pending[coupon_id] = None
+            self._remove(coupon_id)
+
+    def _remove(self, coupon_id):
+        for term in self.documents.pop(coupon_id, ()):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            entry.pop(coupon_id, None)
+            if not entry:
+                del self.postings[term]
+                self.vocabulary_dirty = True
+
+    def _expand(self, term):
+        """
+        Map a query term to (index term, score multiplier) pairs.
+        """
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+
+        matches = []
+        if term in self.postings:
+            matches.append((term, 1.0))
+
+        start = bisect.bisect_right(self.vocabulary, term)
+        for candidate in self.vocabulary[start:start + 50]:
+            if not candidate.startswith(term):
+                break
+            matches.append((candidate, PREFIX_PENALTY))
+
+        if not matches:
+            # Only consider terms sharing the first letter so typo lookups stay cheap
+            lo = bisect.bisect_left(self.vocabulary, term[0])
+            hi = bisect.bisect_left(self.vocabulary, chr(ord(term[0]) + 1))
+            matches = [(candidate, TYPO_PENALTY) for candidate in close_terms(term, self.vocabulary[lo:hi])]
+
+        return matches
+
+    def search(self, query, limit=MAX_RESULTS, queryset=None):
+        self.ensure_built()
+        scores = {}
+
+        with self.lock:
+            total = max(len(self.documents), 1)
+            for term in tokenize(query):
+                for index_term, multiplier in self._expand(term):
+                    entry = self.postings[index_term]
+                    idf = math.log(1 + total / len(entry))
+                    for coupon_id, weight in entry.items():
+                        scores[coupon_id] = scores.get(coupon_id, 0) + weight * idf * multiplier
+
+        def top(n):
+            # Best n only: a heap instead of sorting every match
+            return [coupon_id for coupon_id, _ in heapq.nlargest(n, scores.items(), key=lambda item: (item[1], item[0]))]
+
+        if queryset is None:
+            return top(limit)
+
+        # Check twice as many candidates against the queryset's filters each round until enough pass
+        results = []
+        checked = 0
+        wanted = max(limit, self.FILTER_CHUNK_SIZE)
+        while checked < len(scores):
+            ranked = top(wanted)
+            for start in range(checked, len(ranked), self.FILTER_CHUNK_SIZE):
+                chunk = ranked[start:start + self.FILTER_CHUNK_SIZE]
+                kept = set(queryset.filter(id__in=chunk).values_list('id', flat=True))
+                results.extend(coupon_id for coupon_id in chunk if coupon_id in kept)
+                if len(results) >= limit:
+                    return results[:limit]
+            checked = len(ranked)
+            wanted *= 2
+        return results
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    SQLite FTS5 virtual table mirroring the indexed coupon fields, for local
+    development and tests. The table is created and filled on first use.
+    """
+    table = 'coupon_search'
+    vocab_table = 'coupon_search_vocab'
+
+    def __init__(self):
+        self.ready = False
+
+    def ensure_table(self):
+        if self.ready:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table])
+            exists = cursor.fetchone() is not None
+            if not exists:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {self.table} USING fts5(companyName, category, description)"
+                )
+                cursor.execute(f"CREATE VIRTUAL TABLE {self.vocab_table} USING fts5vocab({self.table}, 'row')")
+        self.ready = True
+        if not exists:
+            self.rebuild()
+
+    def index(self, coupon):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [coupon.id])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, companyName, category, description) VALUES (%s, %s, %s, %s)",
+                [coupon.id, coupon.companyName, coupon.category, coupon.description],
+            )
+
+    def remove(self, coupon_id):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [coupon_id])
+
+    def rebuild(self):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            rows, params = searchable_coupons().values_list(
+                'id', 'companyName', 'category', 'description',
+            ).query.sql_with_params()
+            cursor.execute(f"INSERT INTO {self.table} (rowid, companyName, category, description) {rows}", params)
+
+    def _expand(self, cursor, term):
+        cursor.execute(
+            f"SELECT 1 FROM {self.vocab_table} WHERE term >= %s AND term < %s LIMIT 1",
+            [term, term + '\uffff'],
+        )
+        if cursor.fetchone():
+            return [f'"{term}"*']
+
+        cursor.execute(
+            f"SELECT term FROM {self.vocab_table} WHERE term >= %s AND term < %s",
+            [term[0], chr(ord(term[0]) + 1)],
+        )
+        return [f'"{candidate}"' for candidate in close_terms(term, [row[0] for row in cursor.fetchall()])]
+
+    def search(self, query, limit=MAX_RESULTS, queryset=None):
+        self.ensure_table()
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+
+        with connection.cursor() as cursor:
+            clauses = []
+            for term in tokenize(query):
+                clauses.extend(self._expand(cursor, term))
+            if not clauses:
+                return []
+
+            where, params = f"{self.table} MATCH %s", [' OR '.join(clauses)]
+            if queryset is not None:
+                # Filter in the same statement so the limit applies to matching coupons only
+                subquery, subquery_params = queryset.values('id').query.sql_with_params()
+                where += f" AND rowid IN ({subquery})"
+                params.extend(subquery_params)
+
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {where} "
+                f"ORDER BY bm25({self.table}, {weights}) LIMIT %s",
+                params + [limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Return the process-wide search backend configured by COUPON_SEARCH_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'COUPON_SEARCH_BACKEND', 'Coupon.search.InvertedIndexBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def update_index(coupon):
+    """
+    Index ``coupon`` while it is open, else drop it from the index.
+    """
+    if is_searchable(coupon):
+        get_backend().index(coupon)
+    else:
+        get_backend().remove(coupon.id)
+
+
+def search_coupons(query, limit=MAX_RESULTS, queryset=None):
+    return get_backend().search(query, limit=limit, queryset=queryset)
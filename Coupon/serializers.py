@@ -1,8 +1,30 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Coupon, UserProfile, ChatMessage
+from .images import variant_urls
+from .models import Coupon, UserProfile, ChatMessage, Conversation
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only URLs of the resized variants of an image field, or None without an image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        urls = variant_urls(value.name, value.storage)
+        request = self.context.get('request', None)
+        if request is not None:
+            urls = {variant: request.build_absolute_uri(url) for variant, url in urls.items()}
+        return urls
 
 class ChatMessageSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(required=False)  # Update to handle image uploads
+    imageVariants = ImageVariantsField(source='image')
 
     class Meta:
         model = ChatMessage
@@ -12,20 +34,140 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 class CouponSerializer(serializers.ModelSerializer):
     screenshots = serializers.ImageField(required=False, allow_null=True)  # Update to make screenshots field not required
     couponCode = serializers.CharField(required=False, allow_blank=True)  # Update to make couponCode field not required
+    screenshotsVariants = ImageVariantsField(source='screenshots')  # Thumbnail and WebP URLs for list views
 
     class Meta:
         model = Coupon
-        fields = '__all__'
+        # uploadBatch is bookkeeping of bulk uploads
+        exclude = ['uploadBatch']
+
+
+
+# Nested collections of UserProfileSerializer that clients can pick with ?expand=
+EXPANDABLE_FIELDS = ['availedCoupons', 'uploadedCoupons', 'chat_messages']
+
+# Collections backed by a many-to-many relation that can be prefetched
+PREFETCHABLE_FIELDS = ['availedCoupons', 'uploadedCoupons']
+
+# Maximum number of items returned in each nested collection, newest first
+NESTED_LIMIT = 50
+
+
+def parse_expansion(request):
+    """
+    Read ?expand= and ?fields= into (collections to include, fields to keep).
+
+    Without ?expand= every collection is included. ?fields= limits the
+    response to the listed fields, collections included.
+    """
+    expand = request.GET.get('expand')
+    fields = request.GET.get('fields')
+
+    if expand is None:
+        expand = list(EXPANDABLE_FIELDS)
+    else:
+        expand = [name.strip() for name in expand.split(',') if name.strip() in EXPANDABLE_FIELDS]
+
+    if fields is not None:
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+        expand = [name for name in expand if name in fields]
+
+    return expand, fields
+
 
+def profile_prefetches(expand):
+    """
+    Return Prefetch lookups loading each requested collection with one capped query.
+    """
+    lookups = []
+    for name in expand:
+        if name not in PREFETCHABLE_FIELDS:
+            # chat_messages is loaded by CappedListSerializer with its own capped query
+            continue
+        related_model = UserProfile._meta.get_field(name).related_model
+        lookups.append(Prefetch(
+            name,
+            queryset=related_model.objects.order_by('-id')[:NESTED_LIMIT],
+            to_attr=f'capped_{name}',
+        ))
+    return lookups
+
+
+class CappedListSerializer(serializers.ListSerializer):
+    """
+    Nested collection limited to the newest NESTED_LIMIT items.
+    """
+
+    def get_attribute(self, instance):
+        # Use the capped collection loaded by profile_prefetches() when there is one
+        prefetched = getattr(instance, f'capped_{self.field_name}', None)
+        if prefetched is not None:
+            return prefetched
+        return super().get_attribute(instance).order_by('-id')[:NESTED_LIMIT]
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
     userImage = serializers.ImageField(required=False)  # Update to handle image uploads
+    userImageVariants = ImageVariantsField(source='userImage')
 
-    availedCoupons = CouponSerializer(many=True, read_only=True)
-    uploadedCoupons = CouponSerializer(many=True, read_only=True)
-    chat_messages = ChatMessageSerializer(many=True, read_only=True)
+    availedCoupons = CappedListSerializer(child=CouponSerializer(), read_only=True)
+    uploadedCoupons = CappedListSerializer(child=CouponSerializer(), read_only=True)
+    chat_messages = CappedListSerializer(child=ChatMessageSerializer(), read_only=True)
 
     class Meta:
         model = UserProfile
         fields = '__all__'
+        # Accepted on create and update, never sent back
+        extra_kwargs = {'password': {'write_only': True}}
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Drop nested collections that were not requested
+        if expand is not None:
+            for name in EXPANDABLE_FIELDS:
+                if name not in expand:
+                    self.fields.pop(name, None)
+
+        # Keep only the requested fields
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+
+class UserProfileSummarySerializer(serializers.ModelSerializer):
+    """
+    Flat profile representation for list endpoints: no nested coupons or messages.
+    """
+    userImageVariants = ImageVariantsField(source='userImage')
+
+    class Meta:
+        model = UserProfile
+        fields = ['userId', 'userName', 'userImage', 'userImageVariants']
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """
+    Inbox entry: the chat partner plus a preview of the latest message.
+    """
+    # Length of the latest message preview
+    PREVIEW_LENGTH = 100
+
+    userId = serializers.CharField(source='peer.userId')
+    userName = serializers.CharField(source='peer.userName')
+    userImage = serializers.ImageField(source='peer.userImage')
+    userImageVariants = ImageVariantsField(source='peer.userImage')
+    lastMessageId = serializers.IntegerField(source='last_message_id')
+    lastMessage = serializers.SerializerMethodField()
+    lastTimestamp = serializers.DateTimeField(source='last_timestamp')
+    unreadCount = serializers.IntegerField(source='unread_count')
+
+    class Meta:
+        model = Conversation
+        fields = ['userId', 'userName', 'userImage', 'userImageVariants', 'lastMessageId', 'lastMessage', 'lastTimestamp', 'unreadCount']
+
+    def get_lastMessage(self, conversation):
+        if conversation.last_message is None:
+            return None
+        return conversation.last_message.content[:self.PREVIEW_LENGTH]
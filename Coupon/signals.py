@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import cache
+
+from .images import IMAGE_FIELDS, schedule_release, schedule_variants
+from .models import ChatMessage, Coupon
+from .realtime import publish_chat_message
+from .search import get_backend, update_index
+
+# Sent after a coupon is claimed or released, with coupon_id and user_id
+coupon_availed = Signal()
+coupon_disavailed = Signal()
+
+
+@receiver(post_save, sender=Coupon)
+def index_coupon(sender, instance, **kwargs):
+    # Index only once the write is committed so rolled back coupons never show up in search
+    transaction.on_commit(lambda: update_index(instance))
+
+
+@receiver(post_delete, sender=Coupon)
+def unindex_coupon(sender, instance, **kwargs):
+    coupon_id = instance.id
+    transaction.on_commit(lambda: get_backend().remove(coupon_id))
+
+
+@receiver(coupon_availed)
+def unindex_availed_coupon(sender, coupon_id, **kwargs):
+    # Sent after the claim commits; claimed coupons are not searchable
+    get_backend().remove(coupon_id)
+
+
+@receiver(coupon_disavailed)
+def reindex_released_coupon(sender, coupon_id, **kwargs):
+    coupon = Coupon.objects.filter(id=coupon_id).first()
+    if coupon is not None:
+        update_index(coupon)
+
+
+@receiver(post_save, sender=ChatMessage)
+def push_chat_message(sender, instance, created, **kwargs):
+    # Deliver new messages to connected WebSocket clients once they are committed
+    if created:
+        transaction.on_commit(lambda: publish_chat_message(instance))
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+@receiver(coupon_availed)
+@receiver(coupon_disavailed)
+def invalidate_coupon_cache(sender, **kwargs):
+    # Cached feeds and listings are rebuilt on their next request
+    transaction.on_commit(cache.invalidate)
+
+
+@receiver(pre_save)
+def remember_previous_image(sender, instance, **kwargs):
+    field_name = IMAGE_FIELDS.get(sender)
+    if field_name is None or instance._state.adding:
+        return
+    instance._previous_image = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+
+
+# The image tasks are queued in the saving transaction, so they only exist if it commits
+@receiver(post_save)
+def make_image_variants(sender, instance, created, **kwargs):
+    field_name = IMAGE_FIELDS.get(sender)
+    if field_name is None:
+        return
+    field_file = getattr(instance, field_name)
+    previous = getattr(instance, '_previous_image', None)
+    if created or previous != field_file.name:
+        schedule_variants(field_file)
+
+    # Drop the replaced image if nothing else uses it
+    if previous and previous != field_file.name:
+        schedule_release(previous)
+
+
+@receiver(post_delete)
+def release_image(sender, instance, **kwargs):
+    field_name = IMAGE_FIELDS.get(sender)
+    if field_name is None:
+        return
+    name = getattr(instance, field_name).name
+    if name:
+        schedule_release(name)
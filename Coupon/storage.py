@@ -0,0 +1,92 @@
+import hashlib
+import os
+import posixpath
+import re
+import time
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+# Names produced by ContentAddressedStorage:
+# <directory>/<first two hex digits>/<sha256>[.extension]
+ADDRESSED_NAME_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.[\w.]+)?$')
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def is_addressed(name):
+    return bool(ADDRESSED_NAME_RE.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps each unique upload once, named by its SHA-256.
+
+    ``coupon_screenshots/photo.png`` is stored as
+    ``coupon_screenshots/ab/ab12...ef.png``. Saving the same bytes again
+    returns the existing name without writing, but refreshes the file's
+    modification time: delete_unreferenced() leaves files alone for
+    ``grace`` seconds after that, so the row about to reference the file can
+    commit first. Unreferenced files are removed by images.release_unreferenced().
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+
+        directory, basename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(basename)[1].lower()
+        digest = content_digest(content)
+        name = posixpath.join(directory, digest[:2], digest + extension)
+
+        try:
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            # Not stored yet, or deleted a moment ago as unreferenced
+            return super().save(name, content, max_length=max_length)
+
+    def used_within(self, name, seconds):
+        """
+        Whether ``name`` was written or handed out by save() in the last ``seconds``.
+        """
+        try:
+            return time.time() - os.path.getmtime(self.path(name)) < seconds
+        except FileNotFoundError:
+            return False
+
+    def delete_unreferenced(self, name, is_referenced, grace):
+        """
+        Delete ``name`` unless ``is_referenced()`` is true or save() handed it
+        out in the last ``grace`` seconds. Both are checked once the file has
+        been moved aside: a save() racing with the delete either refreshed it
+        before the move, and it is put back, or finds it missing and writes a
+        new copy. Returns True when the file was deleted.
+        """
+        path = self.path(name)
+        aside = f'{path}.{uuid.uuid4().hex}.releasing'
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return True
+
+        if is_referenced() or time.time() - os.path.getmtime(aside) < grace:
+            # Same bytes as any copy a save() wrote in the meantime
+            os.replace(aside, path)
+            return False
+        os.remove(aside)
+        return True
+
+    def save_exact(self, name, content):
+        """
+        Store ``content`` under ``name`` as given, for files derived from a
+        stored upload (such as image variants) that are named after it.
+        """
+        return super().save(name, content)
@@ -0,0 +1,138 @@
+"""
+Streaming JSON responses for large querysets.
+
+Rows are read in keyset pages of STREAM_CHUNK_SIZE (``id > last id``, one
+query per page) and serialized one at a time, so neither the model instances
+nor the serialized list are ever held in memory as a whole; unlike
+QuerySet.iterator() this holds on MySQL too, whose driver buffers the whole
+result of a query. Clients that send ``Accept: application/x-ndjson`` (or
+``?format=ndjson``) get one JSON document per line; everyone else gets a
+chunked JSON array or object. Views using these helpers list NDJSONRenderer
+in their renderer classes so content negotiation accepts NDJSON.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Rows fetched from the database per round trip
+STREAM_CHUNK_SIZE = 2000
+
+
+def dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders non-streamed responses of NDJSON views, such as errors, as a single line.
+    """
+    media_type = NDJSON_CONTENT_TYPE
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (dumps(data) + '\n').encode()
+
+
+# Renderer classes for views that stream with the helpers below
+STREAMING_RENDERER_CLASSES = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
+
+def wants_ndjson(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return isinstance(renderer, NDJSONRenderer)
+
+
+def keyset_rows(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield the rows of ``queryset`` in primary key order, descending when it is
+    ordered by ``-id``, fetching ``chunk_size`` rows per query.
+    """
+    descending = tuple(queryset.query.order_by) in (('-id',), ('-pk',))
+    queryset = queryset.order_by('-pk' if descending else 'pk')
+    page = queryset
+    while True:
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        page = queryset.filter(pk__lt=rows[-1].pk) if descending else queryset.filter(pk__gt=rows[-1].pk)
+
+
+def serialize_rows(queryset, serializer_class, context=None, chunk_size=STREAM_CHUNK_SIZE):
+    # One serializer instance is enough to represent every row
+    serializer = serializer_class(context=context or {})
+    for instance in keyset_rows(queryset, chunk_size):
+        yield serializer.to_representation(instance)
+
+
+def json_array(rows):
+    yield '['
+    first = True
+    for row in rows:
+        yield dumps(row) if first else ',' + dumps(row)
+        first = False
+    yield ']'
+
+
+def ndjson_lines(rows, type_name=None):
+    for row in rows:
+        yield dumps(row if type_name is None else {'type': type_name, 'data': row}) + '\n'
+
+
+def stream_queryset(request, queryset, serializer_class, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream ``queryset`` as a JSON array, or as NDJSON when the client asks for it.
+    Rows come in id order, newest first when ``queryset`` is ordered by ``-id``.
+    """
+    # Resolve the database now: the rows are read after the view has returned
+    queryset = queryset.using(queryset.db)
+    rows = serialize_rows(queryset, serializer_class, {'request': request}, chunk_size)
+    if wants_ndjson(request):
+        return StreamingHttpResponse(ndjson_lines(rows), content_type=NDJSON_CONTENT_TYPE)
+    return StreamingHttpResponse(json_array(rows), content_type='application/json')
+
+
+def stream_sections(request, sections):
+    """
+    Stream a JSON object built from ``sections``, a list of (key, value) pairs
+    where a value is either plain data or a (queryset, serializer_class) pair
+    that is streamed as an array. As NDJSON every row is a line tagged with its key.
+    """
+    context = {'request': request}
+    sections = [
+        (key, (value[0].using(value[0].db), value[1]) if isinstance(value, tuple) else value)
+        for key, value in sections
+    ]
+
+    def section_rows(value):
+        queryset, serializer_class = value
+        return serialize_rows(queryset, serializer_class, context)
+
+    def as_object():
+        yield '{'
+        for index, (key, value) in enumerate(sections):
+            yield ('' if index == 0 else ',') + dumps(key) + ':'
+            if isinstance(value, tuple):
+                yield from json_array(section_rows(value))
+            else:
+                yield dumps(value)
+        yield '}'
+
+    def as_lines():
+        for key, value in sections:
+            if isinstance(value, tuple):
+                yield from ndjson_lines(section_rows(value), type_name=key)
+            else:
+                yield from ndjson_lines([value], type_name=key)
+
+    if wants_ndjson(request):
+        return StreamingHttpResponse(as_lines(), content_type=NDJSON_CONTENT_TYPE)
+    return StreamingHttpResponse(as_object(), content_type='application/json')
@@ -0,0 +1,310 @@
+"""
+Background tasks stored in the database.
+
+Slow side effects are queued as Task rows instead of running on the request
+thread, so they need no broker beyond the database the app already uses. A
+task is a function decorated with @task; queue it with enqueue(). Queued in
+a transaction, the task commits or rolls back together with the rows it
+belongs to.
+
+Workers (manage.py run_tasks) claim due tasks with a compare-and-set on their
+status, so several workers can share a queue. Each worker runs at most
+TASK_QUEUES[queue] tasks of a queue at once. Failed tasks are retried with
+exponential backoff until they run out of attempts; periodic tasks then wait
+for their next run, at least as long as the backoff, instead of failing for
+good. A task that raises Retry is run again after the delay it asks for
+without using up an attempt. Tasks that were running on a worker that died
+are picked up again after TASK_LOCK_TIMEOUT, so tasks must be safe to run
+twice. TASK_SCHEDULE lists tasks that run periodically.
+
+With TASKS_EAGER the tasks run in-process right after the enqueuing
+transaction commits instead, for development and tests without a worker.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Task name -> function, filled by @task
+TASKS = {}
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+class Retry(Exception):
+    """
+    Raised by a task that cannot do its work yet, to run again in ``delay`` seconds.
+    """
+
+    def __init__(self, delay):
+        super().__init__(f'Retry in {delay}s')
+        self.delay = delay
+
+
+def task(queue='default', max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Register a function as a task that runs on ``queue``. Its arguments must be JSON serializable.
+    """
+    def decorator(func):
+        func.task_name = f'{func.__module__}.{func.__name__}'
+        func.task_queue = queue
+        func.task_max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+
+    return decorator
+
+
+def get_task(name):
+    # Importing the module registers its tasks
+    if name not in TASKS:
+        import_string(name)
+    return TASKS[name]
+
+
+def task_queues():
+    return getattr(settings, 'TASK_QUEUES', {'default': 1})
+
+
+def enqueue(func, args=(), kwargs=None, key=None, delay=0):
+    """
+    Queue a call of the task ``func``, to run no earlier than ``delay`` seconds
+    from now. When ``key`` is given and an unfinished task already holds it,
+    nothing is queued. Returns the Task, or None when eager or deduplicated.
+    """
+    kwargs = kwargs or {}
+    if getattr(settings, 'TASKS_EAGER', False):
+        transaction.on_commit(lambda: run_eagerly(func, args, kwargs))
+        return None
+
+    try:
+        # A savepoint, so a duplicate key does not break the caller's transaction
+        with transaction.atomic():
+            return Task.objects.create(
+                name=func.task_name,
+                queue=func.task_queue,
+                args=list(args),
+                kwargs=kwargs,
+                key=key,
+                max_attempts=func.task_max_attempts,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        if key is None:
+            raise
+        return None
+
+
+def run_eagerly(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Retry as retry:
+        # No worker to come back later; the work is dropped
+        logger.warning('Task %s asked to retry in %ss; dropped, tasks run eagerly', func.task_name, retry.delay)
+    except Exception:
+        logger.exception('Task %s failed', func.task_name)
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before the next attempt: exponential, capped, with jitter
+    so tasks that failed together do not retry together.
+    """
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+    cap = getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 3600)
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+
+def claim(queue, worker_id, limit):
+    """
+    Mark up to ``limit`` due tasks of ``queue`` as running for this worker and return them.
+    """
+    ids = list(
+        Task.objects.filter(status=Task.QUEUED, queue=queue, run_at__lte=timezone.now())
+        .order_by('run_at', 'id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    # Only rows still queued flip, so concurrent workers never claim the same task;
+    # the claim token tells this worker's rows apart afterwards
+    token = f'{worker_id}/{uuid.uuid4().hex[:12]}'
+    Task.objects.filter(id__in=ids, status=Task.QUEUED).update(
+        status=Task.RUNNING, locked_by=token, locked_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(id__in=ids, locked_by=token).order_by('run_at', 'id'))
+
+
+def run_claimed(claimed):
+    """
+    Run a claimed task and record the outcome. Updates only apply while the
+    task is still locked by this claim, in case it was taken back as stale.
+    """
+    mine = Task.objects.filter(id=claimed.id, locked_by=claimed.locked_by)
+    interval = getattr(settings, 'TASK_SCHEDULE', {}).get(claimed.name)
+    try:
+        get_task(claimed.name)(*claimed.args, **claimed.kwargs)
+    except Retry as retry:
+        mine.update(
+            status=Task.QUEUED, locked_by='', locked_at=None, attempts=F('attempts') - 1,
+            run_at=timezone.now() + timedelta(seconds=retry.delay),
+        )
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        if claimed.attempts < claimed.max_attempts:
+            delay = retry_delay(claimed.attempts)
+            logger.warning('Task %s #%s failed, retrying in %.0fs', claimed.name, claimed.id, delay, exc_info=True)
+            mine.update(
+                status=Task.QUEUED, locked_by='', locked_at=None, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+        elif interval:
+            delay = max(interval, retry_delay(claimed.attempts + 1))
+            logger.error(
+                'Periodic task %s #%s failed %d times, next run in %.0fs',
+                claimed.name, claimed.id, claimed.attempts, delay, exc_info=True,
+            )
+            mine.update(
+                status=Task.QUEUED, locked_by='', locked_at=None, attempts=0, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            logger.error('Task %s #%s failed after %d attempts', claimed.name, claimed.id, claimed.attempts, exc_info=True)
+            # Free the key so the work can be queued again
+            mine.update(status=Task.FAILED, locked_by='', locked_at=None, last_error=error, key=None)
+        return False
+
+    if interval:
+        mine.update(
+            status=Task.QUEUED, locked_by='', locked_at=None, attempts=0, last_error='',
+            run_at=timezone.now() + timedelta(seconds=interval),
+        )
+    else:
+        mine.delete()
+    return True
+
+
+def requeue_stale():
+    """
+    Give tasks held by workers that stopped mid-run back to the queue, or fail
+    them when that was their last attempt; periodic tasks are rescheduled.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 600))
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff)
+    for name, interval in getattr(settings, 'TASK_SCHEDULE', {}).items():
+        stale.filter(name=name, attempts__gte=F('max_attempts')).update(
+            status=Task.QUEUED, locked_by='', locked_at=None, attempts=0,
+            last_error='The worker stopped while running the task.',
+            run_at=now + timedelta(seconds=interval),
+        )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, locked_by='', locked_at=None, key=None,
+        last_error='The worker stopped while running the task.',
+    )
+    return stale.update(status=Task.QUEUED, locked_by='', locked_at=None)
+
+
+def ensure_scheduled():
+    """
+    Queue the TASK_SCHEDULE tasks that have no row yet; after every run a
+    periodic task's row is rescheduled rather than deleted.
+    """
+    for name in getattr(settings, 'TASK_SCHEDULE', {}):
+        enqueue(get_task(name), key=f'schedule:{name}')
+
+
+class Worker:
+    """
+    Poll the queues and run claimed tasks in one thread pool per queue.
+    """
+
+    def __init__(self, queues=None, poll_interval=1.0, worker_id=None):
+        self.limits = {queue: limit for queue, limit in task_queues().items() if not queues or queue in queues}
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.executors = {
+            queue: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f'tasks-{queue}')
+            for queue, limit in self.limits.items()
+        }
+        self.in_flight = Counter()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def run(self, once=False):
+        """
+        Work until stop() is called or, with ``once``, until no task is due.
+        Returns the number of tasks run.
+        """
+        ensure_scheduled()
+        next_stale_check = 0
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                if time.monotonic() >= next_stale_check:
+                    requeue_stale()
+                    next_stale_check = time.monotonic() + 60
+
+                claimed = 0
+                for queue, limit in self.limits.items():
+                    with self.lock:
+                        free = limit - self.in_flight[queue]
+                    if free <= 0:
+                        continue
+                    for claimed_task in claim(queue, self.worker_id, free):
+                        with self.lock:
+                            self.in_flight[queue] += 1
+                        self.executors[queue].submit(self.execute, queue, claimed_task)
+                        claimed += 1
+
+                with self.lock:
+                    busy = sum(self.in_flight.values())
+                if once and not claimed and not busy:
+                    break
+                if not claimed:
+                    # Sleep until a task finishes or it is time to poll again
+                    self.wakeup.wait(self.poll_interval)
+                    self.wakeup.clear()
+        finally:
+            # Let running tasks finish; queued ones stay for the next worker
+            for executor in self.executors.values():
+                executor.shutdown(wait=True)
+        return self.processed
+
+    def execute(self, queue, claimed):
+        close_old_connections()
+        try:
+            run_claimed(claimed)
+        except Exception:
+            # Recording the outcome failed; the task is retried once its lock goes stale
+            logger.exception('Could not finish task %s #%s', claimed.name, claimed.id)
+        finally:
+            close_old_connections()
+            with self.lock:
+                self.in_flight[queue] -= 1
+                self.processed += 1
+            self.wakeup.set()
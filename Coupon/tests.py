@@ -1,3 +1,952 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import fakeredis
+import redis
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.base import BaseHandler
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import bulk, cache, media, ratelimit, routers, search, streaming, tasks
+from .authentication import issue_tokens
+from .checks import check_shared_state
+from .expiry import purge_expired_coupons
+from .images import release_unreferenced, variant_name
+from .inbox import backfill_conversations
+from .models import ChatMessage, Conversation, Coupon, Task, UserProfile
+from .storage import ContentAddressedStorage
+from .tasks import Retry, task
+
+
+def make_coupon(**fields):
+    values = {
+        'userId': 'uploader@example.com',
+        'companyName': 'Swiggy',
+        'description': 'Flat 20% off',
+        'category': 'Food',
+        'validityDate': date.today() + timedelta(days=30),
+        'couponCode': 'CODE',
+    }
+    values.update(fields)
+    return Coupon.objects.create(**values)
+
+
+def make_user(user_id, **fields):
+    return UserProfile.objects.create(userId=user_id, email=user_id, userName=user_id, **fields)
+
+
+def cursor_of(link):
+    return parse_qs(urlparse(link).query)['cursor'][0] if link else None
+
+
+class ListQueryCountTests(TestCase):
+    """
+    List endpoints run a fixed number of queries however many rows they return.
+    """
+
+    def test_user_profile_list(self):
+        for i in range(3):
+            make_user(f'user{i}@example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get('/api/user-profiles/').json()), 3)
+
+        for i in range(3, 20):
+            make_user(f'user{i}@example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get('/api/user-profiles/').json()), 20)
+
+    def test_chat_inbox(self):
+        owner = make_user('owner@example.com')
+
+        def add_chats(start, stop):
+            for i in range(start, stop):
+                peer = make_user(f'peer{i}@example.com')
+                ChatMessage.objects.create(sender=owner, receiver=peer, content='hi')
+                ChatMessage.objects.create(sender=peer, receiver=owner, content='hello')
+
+        add_chats(0, 2)
+        with self.assertNumQueries(1):
+            inbox = self.client.get(f'/api/chat/messages/{owner.userId}/').json()
+        self.assertEqual(len(inbox), 2)
+        self.assertEqual(inbox[0]['lastMessage'], 'hello')
+        self.assertEqual(inbox[0]['unreadCount'], 1)
+
+        add_chats(2, 15)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get(f'/api/chat/messages/{owner.userId}/').json()), 15)
+
+
+class ProfileExpansionTests(TestCase):
+    def test_expand_and_fields_ignore_spaces(self):
+        make_user('user@example.com')
+        response = self.client.get(
+            '/api/user-profile/user@example.com/',
+            {'expand': 'availedCoupons, uploadedCoupons', 'fields': 'userId, availedCoupons, uploadedCoupons'},
+        )
+        self.assertEqual(set(response.json()), {'userId', 'availedCoupons', 'uploadedCoupons'})
+
+
+class PasswordHashTests(TestCase):
+    def test_profile_responses_leave_out_the_password_hash(self):
+        user = make_user('user@example.com', password=make_password('secret'))
+        login = self.client.post(
+            '/api/user-profile/login/', {'email': 'user@example.com', 'password': 'secret'}, content_type='application/json',
+        ).json()
+        self.assertNotIn('password', login['profile'])
+
+        me = self.client.get('/api/user-profile/me/', HTTP_AUTHORIZATION=f'Bearer {issue_tokens(user)["access"]}').json()
+        self.assertNotIn('password', me)
+        self.assertNotIn('password', self.client.get('/api/user-profile/user@example.com/').json())
+
+
+class ChatSocketTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner@example.com')
+        self.peer = make_user('peer@example.com')
+        self.message = ChatMessage.objects.create(sender=self.peer, receiver=self.owner, content='hi')
+
+    async def connect(self, token):
+        from Coupons.asgi import application
+
+        communicator = WebsocketCommunicator(application, f'/ws/chat/owner@example.com/?since=0&token={token}')
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_rejects_missing_and_foreign_tokens(self):
+        for token in ('', 'forged', issue_tokens(self.peer)['access']):
+            communicator, connected = await self.connect(token)
+            self.assertFalse(connected)
+            await communicator.disconnect()
+
+    async def test_owner_receives_missed_messages(self):
+        communicator, connected = await self.connect(issue_tokens(self.owner)['access'])
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['id'], self.message.id)
+        await communicator.disconnect()
+
+
+class ConversationBackfillTests(TestCase):
+    def test_builds_inbox_rows_from_existing_messages(self):
+        first, second = make_user('first@example.com'), make_user('second@example.com')
+        # bulk_create skips ChatMessage.save(), like messages that predate the inbox
+        ChatMessage.objects.bulk_create([
+            ChatMessage(sender=first, receiver=second, content='one'),
+            ChatMessage(sender=second, receiver=first, content='two'),
+        ])
+        newest = ChatMessage.objects.latest('id')
+
+        for _ in range(2):
+            self.assertEqual(backfill_conversations(ChatMessage, Conversation), 2)
+            self.assertEqual(
+                sorted(Conversation.objects.values_list('owner_id', 'peer_id', 'last_message_id')),
+                [('first@example.com', 'second@example.com', newest.id), ('second@example.com', 'first@example.com', newest.id)],
+            )
+
+    def test_message_that_loses_the_first_message_race_still_updates_the_inbox(self):
+        first, second = make_user('first@example.com'), make_user('second@example.com')
+        winner = ChatMessage.objects.bulk_create([ChatMessage(sender=second, receiver=first, content='one')])[0]
+        get_or_create = QuerySet.get_or_create
+
+        def create_concurrently(queryset, **kwargs):
+            # The other message creates the row between our UPDATE and our insert
+            Conversation.objects.bulk_create([Conversation(
+                owner_id=kwargs['owner_id'], peer_id=kwargs['peer_id'], last_message=winner,
+                last_timestamp=winner.timestamp, unread_count=int(kwargs['owner_id'] == first.userId),
+            )], ignore_conflicts=True)
+            return get_or_create(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'get_or_create', autospec=True, side_effect=create_concurrently):
+            loser = ChatMessage.objects.create(sender=first, receiver=second, content='two')
+        self.assertEqual(
+            sorted(Conversation.objects.values_list('owner_id', 'last_message_id', 'unread_count')),
+            [('first@example.com', loser.id, 1), ('second@example.com', loser.id, 1)],
+        )
+
+    def test_upsert_without_conflict_target_support(self):
+        first, second = make_user('first@example.com'), make_user('second@example.com')
+        ChatMessage.objects.bulk_create([ChatMessage(sender=first, receiver=second, content='one')])
+
+        # MySQL rejects unique_fields and upserts on the (owner, peer) unique key by itself
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(QuerySet, 'bulk_create') as bulk_create:
+            backfill_conversations(ChatMessage, Conversation)
+        self.assertNotIn('unique_fields', bulk_create.call_args.kwargs)
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+
+
+class CouponCacheTests(TestCase):
+    # Queries a cache hit costs: reading the generation from the database cache
+    hit_queries = 1
+
+    def setUp(self):
+        for alias in (cache.CACHE_ALIAS, cache.GENERATION_CACHE_ALIAS):
+            caches[alias].clear()
+        self.first = make_coupon(companyName='Swiggy')
+
+    def latest_ids(self):
+        return [coupon['id'] for coupon in self.client.get('/api/coupons/latest/').json()['results']]
+
+    def bump_generation_elsewhere(self):
+        # Another server process sees the shared generation through its own cache object
+        other = DatabaseCache('coupon_cache_generation', {})
+        other.incr(cache.GENERATION_KEY)
+
+    def test_pages_are_cached_until_a_write_commits(self):
+        hits = cache.stats.hits
+        self.assertEqual(self.latest_ids(), [self.first.id])
+
+        # Written without signals: the cached page does not know about it yet
+        hidden = Coupon.objects.bulk_create([Coupon(
+            userId='uploader@example.com', companyName='Ola', description='', category='Travel',
+            validityDate=self.first.validityDate, couponCode='CODE',
+        )])[0]
+        with self.assertNumQueries(self.hit_queries):
+            self.assertEqual(self.latest_ids(), [self.first.id])
+        self.assertEqual(cache.stats.hits, hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = make_coupon(companyName='Zomato')
+        self.assertEqual(self.latest_ids(), [second.id, hidden.id, self.first.id])
+
+    def test_write_in_another_process_retires_pages(self):
+        self.assertEqual(self.latest_ids(), [self.first.id])
+        second = Coupon.objects.bulk_create([Coupon(
+            userId='uploader@example.com', companyName='Ola', description='', category='Travel',
+            validityDate=self.first.validityDate, couponCode='CODE',
+        )])[0]
+        self.bump_generation_elsewhere()
+        self.assertEqual(self.latest_ids(), [second.id, self.first.id])
+
+
+REDIS_FAKE = {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': 'redis://coupon-cache-fake:6379/0',
+    'OPTIONS': {'connection_class': fakeredis.FakeConnection},
+}
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'coupons': REDIS_FAKE,
+    'coupon_generation': REDIS_FAKE,
+})
+class RedisCouponCacheTests(CouponCacheTests):
+    """
+    The same behaviour with pages and generation in Redis, as configured by COUPON_CACHE_REDIS_URL.
+    """
+    hit_queries = 0
+
+    def bump_generation_elsewhere(self):
+        other = redis.Redis.from_url(REDIS_FAKE['LOCATION'], connection_class=fakeredis.FakeConnection)
+        [key] = other.keys('*coupons:generation')
+        other.incr(key)
+
+
+class CouponListFilterTests(TestCase):
+    def test_company_name_matches_substrings_of_the_name_only(self):
+        basket = make_coupon(companyName='BigBasket', category='Grocery')
+        make_coupon(companyName='Swiggy', category='Food', description='Food delivery')
+
+        response = self.client.get('/api/coupons/', {'companyName': 'bask'})
+        self.assertEqual([coupon['id'] for coupon in response.json()['results']], [basket.id])
+
+        response = self.client.get('/api/coupons/', {'companyName': 'food'})
+        self.assertEqual(response.json()['results'], [])
+
+
+class CouponSearchTests(TestCase):
+    def setUp(self):
+        # Every test starts from an empty process-wide backend
+        patcher = mock.patch.object(search, '_backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def seed_mostly_other_category(self):
+        for i in range(30):
+            make_coupon(companyName='Uber', category='Travel', couponCode=f'RIDE{i}')
+        return {make_coupon(companyName='Uber', category='Food').id, make_coupon(companyName='Uber', category='Food').id}
+
+    def search_ids(self, **params):
+        response = self.client.get('/api/coupons/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [coupon['id'] for coupon in response.json()['results']]
+
+    def test_filters_apply_before_the_result_limit(self):
+        food_ids = self.seed_mostly_other_category()
+        with mock.patch.object(search.InvertedIndexBackend, 'FILTER_CHUNK_SIZE', 5):
+            self.assertEqual(set(self.search_ids(q='uber', category='Food', limit=2)), food_ids)
+
+    @override_settings(COUPON_SEARCH_BACKEND='Coupon.search.SQLiteFTS5Backend')
+    def test_fts5_filters_apply_before_the_result_limit(self):
+        food_ids = self.seed_mostly_other_category()
+        self.assertEqual(set(self.search_ids(q='uber', category='Food', limit=2)), food_ids)
+
+    def test_only_open_coupons_are_indexed(self):
+        make_coupon(companyName='Uber', isAvailed=True)
+        make_coupon(companyName='Uber', validityDate=date.today() - timedelta(days=1))
+        coupon = make_coupon(companyName='Uber')
+        backend = search.get_backend()
+        self.assertEqual(backend.search('uber'), [coupon.id])
+
+        auth = f'Bearer {issue_tokens(make_user("rider@example.com"))["access"]}'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/coupons/{coupon.id}/avail/rider@example.com/', HTTP_AUTHORIZATION=auth)
+        self.assertEqual(backend.search('uber'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/coupons/{coupon.id}/disavail/rider@example.com/', HTTP_AUTHORIZATION=auth)
+        self.assertEqual(backend.search('uber'), [coupon.id])
+
+    def test_rebuild_command_leaves_per_process_indexes_alone(self):
+        output = StringIO()
+        with mock.patch.object(search.InvertedIndexBackend, 'rebuild') as rebuild:
+            call_command('rebuild_search_index', stdout=output)
+        rebuild.assert_not_called()
+        self.assertIn('kept in each server process', output.getvalue())
+
+    def test_ranks_prefix_and_typo_matches(self):
+        exact = make_coupon(companyName='Myntra', description='Fashion sale')
+        make_coupon(companyName='Nykaa', description='Beauty sale')
+
+        self.assertEqual(self.search_ids(q='myn'), [exact.id])
+        self.assertEqual(self.search_ids(q='mintra'), [exact.id])
+
+    def test_writes_during_a_rebuild_are_kept(self):
+        backend = search.InvertedIndexBackend()
+        coupon = make_coupon(companyName='Zomato')
+        backend.rebuild()
+        self.assertEqual(backend.search('zomato'), [coupon.id])
+
+        # A write that lands while the rows are being read survives the swap
+        real_add = backend._add
+
+        def add_during_rebuild(postings, coupon_id, fields):
+            if not backend.pending:
+                added = Coupon(id=coupon.id + 1000, companyName='Ola', category='Travel', description='')
+                backend.index(added)
+            return real_add(postings, coupon_id, fields)
+
+        with mock.patch.object(backend, '_add', add_during_rebuild):
+            backend.rebuild()
+        self.assertEqual(backend.search('ola'), [coupon.id + 1000])
+
+
+class ImageReleaseTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+        self.name = self.storage.save('coupon_screenshots/photo.png', ContentFile(b'photo'))
+        self.storage.save_exact(variant_name(self.name, 'thumbnail'), ContentFile(b'thumb'))
+
+    def age(self, seconds=3600):
+        past = time.time() - seconds
+        os.utime(self.storage.path(self.name), (past, past))
+
+    def test_saving_the_same_bytes_keeps_a_fresh_file(self):
+        with self.assertRaises(Retry):
+            release_unreferenced(self.name, self.storage)
+        self.age()
+        self.assertEqual(self.storage.save('coupon_screenshots/other.png', ContentFile(b'photo')), self.name)
+        with self.assertRaises(Retry):
+            release_unreferenced(self.name, self.storage)
+        self.assertTrue(self.storage.exists(self.name))
+
+    def test_deletes_unreferenced_files_and_variants(self):
+        self.age()
+        self.assertTrue(release_unreferenced(self.name, self.storage))
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertFalse(self.storage.exists(variant_name(self.name, 'thumbnail')))
+
+        # The next upload of the same bytes writes the file again
+        self.assertEqual(self.storage.save('coupon_screenshots/photo.png', ContentFile(b'photo')), self.name)
+        self.assertEqual(self.storage.open(self.name).read(), b'photo')
+
+    def test_reference_added_during_the_delete_keeps_the_file(self):
+        self.age()
+        real_rename = os.rename
+
+        def rename_then_reference(source, target):
+            real_rename(source, target)
+            make_coupon(screenshots=self.name)
+
+        with mock.patch('os.rename', rename_then_reference):
+            self.assertFalse(release_unreferenced(self.name, self.storage))
+        self.assertEqual(self.storage.open(self.name).read(), b'photo')
+        self.assertTrue(self.storage.exists(variant_name(self.name, 'thumbnail')))
+
+
+class SharedStateCheckTests(TestCase):
+    def error_ids(self):
+        return {message.id for message in check_shared_state(None)}
+
+    @override_settings(SERVER_PROCESSES=1, SERVER_MODE='asgi')
+    def test_one_process_may_keep_state_in_memory(self):
+        self.assertEqual(self.error_ids(), set())
+
+    @override_settings(SERVER_PROCESSES=4, SERVER_MODE='asgi')
+    def test_several_processes_need_shared_rate_limits_and_channel_layer(self):
+        self.assertEqual(self.error_ids(), {'Coupon.E001', 'Coupon.E002', 'Coupon.W001'})
+
+        with override_settings(
+            RATE_LIMIT_BACKEND='Coupon.ratelimit.CacheBackend',
+            CACHES={**settings.CACHES, 'ratelimit': REDIS_FAKE},
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}},
+        ):
+            self.assertEqual(self.error_ids(), {'Coupon.W001'})
+
+
+class ReplicaReadTests(TestCase):
+    def setUp(self):
+        for alias in (cache.CACHE_ALIAS, cache.GENERATION_CACHE_ALIAS):
+            caches[alias].clear()
+
+    def fill_alias(self):
+        # The alias a cache miss inside a @read_from_replica view reads from
+        seen = []
+        token = routers._read_alias.set(routers.REPLICA_ALIAS)
+        try:
+            cache.cached_payload('latest', RequestFactory().get('/api/coupons/latest/'), lambda: seen.append(routers._read_alias.get()))
+        finally:
+            routers._read_alias.reset(token)
+        caches[cache.CACHE_ALIAS].clear()
+        return seen[0]
+
+    def test_misses_right_after_a_write_read_the_primary(self):
+        self.assertEqual(self.fill_alias(), routers.REPLICA_ALIAS)
+        cache.invalidate()
+        self.assertIsNone(self.fill_alias())
+        with mock.patch('Coupon.cache.time.time', return_value=time.time() + 10):
+            self.assertEqual(self.fill_alias(), routers.REPLICA_ALIAS)
+
+    def test_pin_cookie_is_sent_cross_site(self):
+        middleware = routers.ReplicaPinningMiddleware(lambda request: HttpResponse())
+        with mock.patch.object(routers, 'replica_configured', return_value=True):
+            response = middleware(RequestFactory().post('/api/coupons/'))
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['samesite'], 'None')
+        self.assertTrue(cookie['secure'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner@example.com')
+        self.auth = f'Bearer {issue_tokens(self.owner)["access"]}'
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_coupons_stream_newest_first_in_pages(self):
+        ids = [make_coupon(couponCode=f'CODE{i}').id for i in range(7)]
+        self.assertEqual(self.client.get('/api/coupons/export/').status_code, 401)
+
+        rows = self.read(self.client.get('/api/coupons/export/', HTTP_AUTHORIZATION=self.auth))
+        self.assertEqual([row['id'] for row in rows], ids[::-1])
+
+        # One query per page, each starting after the last id of the previous one
+        with self.assertNumQueries(3):
+            self.assertEqual([coupon.id for coupon in streaming.keyset_rows(Coupon.objects.order_by('-id'), 3)], ids[::-1])
+        with self.assertNumQueries(3):
+            self.assertEqual([coupon.id for coupon in streaming.keyset_rows(Coupon.objects.all(), 3)], ids)
+
+    def test_user_export_is_limited_to_the_token_user(self):
+        other = make_user('other@example.com')
+        self.assertEqual(self.client.get('/api/user-profile/owner@example.com/export/').status_code, 401)
+        response = self.client.get(
+            '/api/user-profile/owner@example.com/export/', HTTP_AUTHORIZATION=f'Bearer {issue_tokens(other)["access"]}',
+        )
+        self.assertEqual(response.status_code, 403)
+        data = self.read(self.client.get('/api/user-profile/owner@example.com/export/', HTTP_AUTHORIZATION=self.auth))
+        self.assertEqual(data['profile']['email'], 'owner@example.com')
+
+
+class MetricsAccessTests(TestCase):
+    def test_loopback_only_without_a_token(self):
+        self.assertEqual(self.client.get('/api/metrics/cache/').status_code, 200)
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+
+@override_settings(RATE_LIMITS={'avail-coupon': {'methods': ['POST'], 'user': '2/minute', 'ip': '100/minute'}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, '_backend', ratelimit.MemoryBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.victim = make_user('victim@example.com')
+        self.coupon = make_coupon()
+
+    def claim(self, **headers):
+        return self.client.post(f'/api/coupons/{self.coupon.id}/avail/victim@example.com/', **headers).status_code
+
+    def test_claims_without_a_valid_token_are_refused(self):
+        for _ in range(5):
+            self.assertEqual(self.claim(), 401)
+        self.assertEqual(self.claim(HTTP_AUTHORIZATION='Bearer forged'), 401)
+        self.assertFalse(Coupon.objects.get(id=self.coupon.id).isAvailed)
+
+    def test_user_named_in_the_url_is_not_rate_limited_for_others(self):
+        other = f'Bearer {issue_tokens(make_user("other@example.com"))["access"]}'
+        self.assertEqual(self.claim(HTTP_AUTHORIZATION=other), 403)
+        self.assertEqual(self.claim(HTTP_AUTHORIZATION=other), 403)
+        self.assertEqual(self.claim(HTTP_AUTHORIZATION=f'Bearer {issue_tokens(self.victim)["access"]}'), 201)
+
+    def test_chat_posts_need_the_senders_token(self):
+        make_user('friend@example.com')
+        for path in ('/api/chat/messages/victim@example.com/friend@example.com/',
+                     '/api/async/chat/messages/victim@example.com/friend@example.com/'):
+            self.assertEqual(self.client.post(path, {'content': 'hi'}, content_type='application/json').status_code, 401)
+            self.assertEqual(self.client.post(
+                path, {'content': 'hi'}, content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {issue_tokens(UserProfile(userId="friend@example.com"))["access"]}',
+            ).status_code, 403)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_token_user_has_a_bucket(self):
+        auth = f'Bearer {issue_tokens(self.victim)["access"]}'
+        self.assertNotEqual(self.claim(HTTP_AUTHORIZATION=auth), 429)
+        self.assertNotEqual(self.claim(HTTP_AUTHORIZATION=auth), 429)
+        self.assertEqual(self.claim(HTTP_AUTHORIZATION=auth), 429)
+
+
+@task(max_attempts=2)
+def failing_task():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASK_SCHEDULE={failing_task.task_name: 3600}, TASKS_EAGER=False)
+class PeriodicTaskTests(TestCase):
+    def run_once(self):
+        [claimed] = tasks.claim('default', 'test', 1)
+        with self.assertLogs('Coupon.tasks'):
+            tasks.run_claimed(claimed)
+        return Task.objects.get(id=claimed.id)
+
+    def test_reschedules_after_the_last_attempt(self):
+        tasks.ensure_scheduled()
+        self.assertEqual(self.run_once().status, Task.QUEUED)
+        Task.objects.update(run_at=timezone.now())
+
+        row = self.run_once()
+        self.assertEqual((row.status, row.attempts), (Task.QUEUED, 0))
+        self.assertEqual(row.key, f'schedule:{failing_task.task_name}')
+        self.assertGreater(row.run_at, timezone.now() + timedelta(seconds=3500))
+        self.assertIn('boom', row.last_error)
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, content=b'0123456789'):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(content)
+
+    def get(self, name, **headers):
+        response = self.client.get(f'/media/{name}', **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_full_file_keeps_the_sendfile_path(self):
+        self.write('photo.png')
+        # Through the middleware only: the test client wraps streaming bodies itself
+        handler = BaseHandler()
+        handler.load_middleware()
+        response = handler.get_response(RequestFactory().get('/media/photo.png'))
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        # Wrapping the body would keep WSGI servers from using wsgi.file_wrapper
+        self.assertIsNotNone(response.file_to_stream)
+
+    def test_byte_ranges(self):
+        self.write('photo.png')
+        response = self.get('photo.png', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.get('photo.png', HTTP_RANGE='bytes=-3')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 7-9/10'))
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.get('photo.png', HTTP_RANGE='bytes=20-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+    def test_range_is_ignored_when_if_range_does_not_match(self):
+        self.write('photo.png')
+        response = self.get('photo.png', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+        response = self.get('photo.png', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+
+    def test_not_modified(self):
+        self.write('photo.png')
+        etag = self.get('photo.png')['ETag']
+        response = self.get('photo.png', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_content_addressed_names_are_immutable(self):
+        name = 'coupon_screenshots/ab/ab' + '0' * 62 + '.png'
+        self.write(name)
+        response = self.get(name)
+        self.assertEqual(response['Cache-Control'], media.IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['ETag'], f'"ab{"0" * 62}.png"')
+
+        self.write('photo.png')
+        self.assertNotIn('immutable', self.get('photo.png')['Cache-Control'])
+
+    def test_paths_outside_media_root_are_not_found(self):
+        outside = tempfile.NamedTemporaryFile(dir=os.path.dirname(self.root))
+        self.addCleanup(outside.close)
+        self.assertEqual(self.get(f'../{os.path.basename(outside.name)}').status_code, 404)
+        self.assertEqual(self.get('missing.png').status_code, 404)
+
+    def test_front_end_server_sends_the_file(self):
+        self.write('coupon_screenshots/photo 1.png')
+        with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.get('coupon_screenshots/photo 1.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/coupon_screenshots/photo%201.png')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(MEDIA_SENDFILE_HEADER='X-Sendfile'):
+            response = self.get('coupon_screenshots/photo 1.png')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root, 'coupon_screenshots', 'photo 1.png'))
+        self.assertEqual(response.content, b'')
+
+
+class BulkUploadTests(TestCase):
+    def setUp(self):
+        make_user('uploader@example.com')
+
+    def row(self, code, **fields):
+        return {
+            'userId': 'uploader@example.com', 'companyName': 'Swiggy', 'description': 'Bulk', 'category': 'Food',
+            'validityDate': (date.today() + timedelta(days=30)).isoformat(), 'couponCode': code, **fields,
+        }
+
+    def upload(self, rows, **params):
+        return self.client.post('/api/coupons/bulk/' + ('?stream=true' if params.get('stream') else ''), rows, content_type='application/json')
+
+    def test_partial_failure_reports_rows_with_207(self):
+        response = self.upload([self.row('A'), self.row('B', userId='ghost@example.com'), self.row('C', validityDate='soon')])
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual(list(Coupon.objects.filter(id__in=body['created']).values_list('couponCode', flat=True)), ['A'])
+        self.assertEqual([error['row'] for error in body['errors']], [2, 3])
+        self.assertIn('userId', body['errors'][0]['errors'])
+        self.assertEqual(self.upload([self.row('D', userId='ghost@example.com')]).status_code, 400)
+
+    def test_csv_body(self):
+        rows = [self.row('A'), self.row('B')]
+        header = list(rows[0])
+        body = ','.join(header) + '\n' + ''.join(','.join(row[name] for name in header) + '\n' for row in rows)
+        response = self.client.post('/api/coupons/bulk/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(UserProfile.objects.get(userId='uploader@example.com').uploadedCoupons.values_list('couponCode', flat=True)),
+            ['A', 'B'],
+        )
+
+    def test_streamed_progress_per_batch(self):
+        rows = [self.row(f'C{i}') for i in range(bulk.BULK_BATCH_SIZE + 1)] + [self.row('X', category='')]
+        response = self.upload(rows, stream=True)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line.get('processed') for line in lines[:2]], [bulk.BULK_BATCH_SIZE, len(rows)])
+        self.assertEqual(len(lines[1]['errors']), 1)
+        self.assertEqual(lines[2], {'done': True, 'processed': len(rows), 'created': len(rows) - 1, 'failed': 1})
+
+    def test_without_returning_ids_reads_them_back_per_batch(self):
+        # As on MySQL: bulk_create cannot return ids
+        def insert(count):
+            coupons = [Coupon(**{**self.row(f'{count}-{i}'), 'validityDate': date.today()}) for i in range(count)]
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                ids = bulk.insert_batch(coupons)
+            return ids, len(queries)
+
+        backend = search.InvertedIndexBackend()
+        backend.rebuild()
+        no_returning = mock.patch.object(
+            type(connection.features), 'can_return_rows_from_bulk_insert', new_callable=mock.PropertyMock, return_value=False,
+        )
+        with no_returning, mock.patch.object(search, '_backend', backend), \
+                mock.patch.object(cache, 'invalidate') as invalidate:
+            few_ids, few_queries = insert(2)
+            many_ids, many_queries = insert(20)
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(invalidate.call_count, 2)
+        self.assertEqual(
+            list(Coupon.objects.filter(id__in=many_ids).order_by('id').values_list('couponCode', flat=True)),
+            [f'20-{i}' for i in range(20)],
+        )
+        self.assertEqual(set(backend.search('swiggy', limit=100)), set(few_ids + many_ids))
+        self.assertNotIn('uploadBatch', self.client.get(f'/api/coupons/{many_ids[0]}/').json())
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner@example.com')
+        self.ids = [make_coupon(companyName=f'Company {i}').id for i in range(7)]
+
+    def pages(self, path, direction, **params):
+        # Follow the ``direction`` links from ``path``, recording each page's ids and cursors
+        pages = []
+        while True:
+            data = self.client.get(path, params).json()
+            pages.append((
+                [coupon['id'] for coupon in data['results']],
+                cursor_of(data['next']), cursor_of(data['previous']),
+            ))
+            if not data[direction]:
+                return pages
+            params['cursor'] = cursor_of(data[direction])
+
+    def test_async_cursor_pages_match_the_sync_ones(self):
+        forward = self.pages('/api/coupons/', 'next', limit=3)
+        self.assertEqual(forward, self.pages('/api/async/coupons/', 'next', limit=3))
+        self.assertEqual([coupon_id for ids, _, _ in forward for coupon_id in ids], self.ids[::-1])
+        self.assertEqual(len(forward), 3)
+
+        last = forward[-1][2]
+        backward = self.pages('/api/coupons/', 'previous', limit=3, cursor=last)
+        self.assertEqual(backward, self.pages('/api/async/coupons/', 'previous', limit=3, cursor=last))
+        self.assertEqual(backward[0][0], forward[1][0])
+
+        for path in ('/api/coupons/', '/api/async/coupons/'):
+            self.assertEqual(self.client.get(path, {'cursor': 'garbage'}).status_code, 404)
+
+    def test_async_create_rejects_unknown_uploader(self):
+        payload = {
+            'userId': 'nobody@example.com', 'companyName': 'Uber', 'description': 'Rides', 'category': 'Travel',
+            'validityDate': (date.today() + timedelta(days=30)).isoformat(), 'couponCode': 'RIDE',
+        }
+        response = self.client.post('/api/async/coupons/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': {'userId': ['Unknown user.']}})
+        self.assertFalse(Coupon.objects.filter(companyName='Uber').exists())
+
+        payload['userId'] = self.owner.userId
+        response = self.client.post('/api/async/coupons/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.owner.uploadedCoupons.filter(id=response.json()['id']).exists())
+
+    def test_async_chat_post(self):
+        make_user('friend@example.com')
+        path = '/api/async/chat/messages/owner@example.com/friend@example.com/'
+        response = self.client.post(
+            path, {'content': 'hello'}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {issue_tokens(self.owner)["access"]}',
+        )
+        self.assertEqual(response.status_code, 201)
+        message = ChatMessage.objects.get()
+        self.assertEqual((message.sender_id, message.receiver_id, message.content), (
+            'owner@example.com', 'friend@example.com', 'hello',
+        ))
+        self.assertEqual(Conversation.objects.get(owner_id='friend@example.com').unread_count, 1)
+        self.assertEqual([m['id'] for m in self.client.get(path).json()], [message.id])
+
+
+class CouponClaimTests(TestCase):
+    def setUp(self):
+        self.coupon = make_coupon()
+        self.first, self.second = make_user('first@example.com'), make_user('second@example.com')
+
+    def post(self, action, user):
+        return self.client.post(
+            f'/api/coupons/{self.coupon.id}/{action}/{user.userId}/',
+            HTTP_AUTHORIZATION=f'Bearer {issue_tokens(user)["access"]}',
+        )
+
+    def test_only_one_claim_wins(self):
+        statuses = [self.post('avail', user).status_code for user in (self.first, self.second, self.first)]
+        self.assertEqual(statuses, [201, 409, 409])
+        self.assertEqual(list(UserProfile.availedCoupons.through.objects.values_list('userprofile_id', flat=True)), [
+            'first@example.com',
+        ])
+
+    def test_only_the_holder_can_release(self):
+        self.post('avail', self.first)
+        self.assertEqual(self.post('disavail', self.second).status_code, 409)
+        self.assertTrue(Coupon.objects.get(id=self.coupon.id).isAvailed)
+
+        self.assertEqual(self.post('disavail', self.first).status_code, 200)
+        self.assertEqual(self.post('disavail', self.first).status_code, 400)
+        self.assertEqual(self.post('avail', self.second).status_code, 201)
+
+    def test_expired_coupons_cannot_be_claimed(self):
+        Coupon.objects.filter(id=self.coupon.id).update(validityDate=date.today() - timedelta(days=1))
+        self.assertEqual(self.post('avail', self.first).status_code, 400)
+
+
+class ChatWindowTests(TestCase):
+    path = '/api/chat/messages/first@example.com/second@example.com/'
+
+    def setUp(self):
+        first, second = make_user('first@example.com'), make_user('second@example.com')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(sender=(first, second)[i % 2], receiver=(second, first)[i % 2], content=str(i)) for i in range(10)
+        ])
+        self.ids = list(ChatMessage.objects.order_by('id').values_list('id', flat=True))
+
+    def window(self, **params):
+        response = self.client.get(self.path, params)
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.json()]
+
+    def test_windows(self):
+        self.assertEqual(self.window(limit=3), self.ids[-3:])
+        self.assertEqual(self.window(after_id=self.ids[2], limit=3), self.ids[3:6])
+        self.assertEqual(self.window(before_id=self.ids[5], limit=3), self.ids[2:5])
+        self.assertEqual(self.window(after_id=self.ids[-1]), [])
+        self.assertEqual(self.window(), self.ids)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(self.window(limit=0), self.ids[-1:])
+        with mock.patch('Coupon.views.CHAT_MAX_PAGE_SIZE', 4):
+            self.assertEqual(self.window(limit=1000), self.ids[-4:])
+
+    def test_non_integer_ids_are_rejected(self):
+        for params in ({'after_id': 'x'}, {'before_id': '1.5'}, {'limit': 'all'}):
+            self.assertEqual(self.client.get(self.path, params).status_code, 400)
+
+    def test_unchanged_window_is_not_modified(self):
+        etag = self.client.get(self.path, {'limit': 3})['ETag']
+        self.assertEqual(self.client.get(self.path, {'limit': 3}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A different window or a new message changes the ETag
+        self.assertEqual(self.client.get(self.path, {'limit': 4}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        ChatMessage.objects.create(sender_id='second@example.com', receiver_id='first@example.com', content='new')
+        self.assertEqual(self.client.get(self.path, {'limit': 3}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CouponPaginationTests(TestCase):
+    def test_pages_are_stable_across_inserts(self):
+        ids = [make_coupon(companyName=f'Company {i}').id for i in range(5)]
+        first = self.client.get('/api/coupons/', {'limit': 2}).json()
+        self.assertEqual([coupon['id'] for coupon in first['results']], ids[:-3:-1])
+
+        # Offsets would shift by the new rows and repeat the end of the first page
+        make_coupon(companyName='Newer')
+        make_coupon(companyName='Newest')
+        second = self.client.get('/api/coupons/', {'limit': 2, 'cursor': cursor_of(first['next'])}).json()
+        self.assertEqual([coupon['id'] for coupon in second['results']], ids[2:0:-1])
+        third = self.client.get('/api/coupons/', {'limit': 2, 'cursor': cursor_of(second['next'])}).json()
+        self.assertEqual([coupon['id'] for coupon in third['results']], ids[:1])
+        self.assertIsNone(third['next'])
+
+    def test_list_and_latest_return_the_paginated_envelope(self):
+        make_coupon(userId='me@example.com')
+        other = make_coupon(userId='other@example.com')
+        for path in ('/api/coupons/', '/api/coupons/latest/'):
+            data = self.client.get(path, {'userId': 'me@example.com'}).json()
+            self.assertEqual(set(data), {'next', 'previous', 'results'})
+            self.assertEqual([coupon['id'] for coupon in data['results']], [other.id])
+            self.assertIsNone(data['previous'])
+
+
+class ExpiryTests(TestCase):
+    def setUp(self):
+        today = date.today()
+        self.expired = [make_coupon(validityDate=today - timedelta(days=i + 1)).id for i in range(5)]
+        self.active = [make_coupon(validityDate=today).id, make_coupon(validityDate=today + timedelta(days=1)).id]
+        holder = make_user('holder@example.com')
+        holder.availedCoupons.add(self.expired[0], self.active[0])
+
+    def test_active_and_expired_split_on_today(self):
+        self.assertEqual(sorted(Coupon.objects.active().values_list('id', flat=True)), self.active)
+        self.assertEqual(sorted(Coupon.objects.expired().values_list('id', flat=True)), self.expired)
+        listed = [coupon['id'] for coupon in self.client.get('/api/coupons/').json()['results']]
+        self.assertEqual(sorted(listed), self.active)
+
+    def test_purge_deletes_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(purge_expired_coupons(batch_size=2), 5)
+        coupon_deletes = [
+            query for query in queries
+            if query['sql'].startswith('DELETE') and f'"{Coupon._meta.db_table}"' in query['sql'].split('WHERE')[0]
+        ]
+        self.assertEqual(len(coupon_deletes), 3)
+        self.assertEqual(sorted(Coupon.objects.values_list('id', flat=True)), self.active)
+        self.assertEqual(
+            list(UserProfile.availedCoupons.through.objects.values_list('coupon_id', flat=True)), self.active[:1],
+        )
+
+    def test_command(self):
+        output = StringIO()
+        call_command('purge_expired_coupons', '--batch-size', '2', stdout=output)
+        self.assertEqual(output.getvalue().strip(), 'Deleted 5 expired coupons')
+        self.assertFalse(Coupon.objects.expired().exists())
+
+
+@override_settings(TASKS_EAGER=True)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        make_user('uploader@example.com')
+
+    def png(self, size=(640, 480)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, format='PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_writes_and_exposes_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/coupons/', {
+                'userId': 'uploader@example.com', 'companyName': 'Swiggy', 'description': 'Flat 20% off',
+                'category': 'Food', 'validityDate': (date.today() + timedelta(days=30)).isoformat(),
+                'couponCode': 'CODE', 'screenshots': self.png(),
+            })
+        self.assertEqual(response.status_code, 201)
+        name = Coupon.objects.get().screenshots.name
+
+        sizes = {}
+        for variant in ('thumbnail', 'full'):
+            path = os.path.join(self.root, variant_name(name, variant))
+            with Image.open(path) as image:
+                self.assertEqual(image.format, 'WEBP')
+                sizes[variant] = image.size
+        self.assertEqual(sizes, {'thumbnail': (320, 240), 'full': (640, 480)})
+
+        variants = self.client.get('/api/coupons/').json()['results'][0]['screenshotsVariants']
+        self.assertEqual(set(variants), {'thumbnail', 'full'})
+        for url in variants.values():
+            response = self.client.get(urlparse(url).path)
+            self.addCleanup(response.close)
+            self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
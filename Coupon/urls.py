@@ -1,4 +1,5 @@
 from django.urls import path
+from . import async_views
 from .views import (
     coupon_list_create,
     coupon_detail,
@@ -6,21 +7,47 @@ from .views import (
     user_profile_detail,
     chat_messages,
     user_chat_list,
+    mark_chat_read,
     avail_coupon,
     disavail_coupon,
     latest_coupons,
-    user_login
+    coupon_search,
+    coupon_bulk_upload,
+    coupon_export,
+    user_data_export,
+    user_login,
+    refresh_token,
+    current_user_profile,
+    cache_metrics,
+    prometheus_metrics,
+    health,
+    readiness,
 )
 
 urlpatterns = [
     path('coupons/', coupon_list_create, name='coupon-list-create'),
     path('coupons/<int:id>/', coupon_detail, name='coupon-detail'),
     path('coupons/latest/', latest_coupons, name='latest_coupons'),
+    path('coupons/search/', coupon_search, name='coupon-search'),
+    path('coupons/bulk/', coupon_bulk_upload, name='coupon-bulk-upload'),
+    path('coupons/export/', coupon_export, name='coupon-export'),
     path('user-profiles/', user_profile_list, name='user-profile-list'),
-    path('user-profile/login/<str:email>/<str:password>/', user_login, name='user-login'),
+    path('user-profile/login/', user_login, name='user-login'),
+    path('user-profile/token/refresh/', refresh_token, name='token-refresh'),
+    path('user-profile/me/', current_user_profile, name='current-user-profile'),
+    path('user-profile/<str:email>/export/', user_data_export, name='user-data-export'),
     path('user-profile/<str:email>/', user_profile_detail, name='user-profile-detail'),    
     path('chat/messages/<str:user_id>/', user_chat_list, name='user_chat_list'),
     path('chat/messages/<str:user_id>/<str:other_user_id>/', chat_messages, name='chat_messages'),
+    path('chat/messages/<str:user_id>/<str:other_user_id>/read/', mark_chat_read, name='chat-mark-read'),
     path('coupons/<int:id>/avail/<str:user_id>/', avail_coupon, name='avail-coupon'),  
     path('coupons/<int:id>/disavail/<str:user_id>/', disavail_coupon, name='disavail-coupon'),  
+    # Async versions of the read-heavy endpoints, for the ASGI server
+    path('async/coupons/', async_views.coupon_list_create, name='async-coupon-list-create'),
+    path('async/coupons/latest/', async_views.latest_coupons, name='async-latest-coupons'),
+    path('async/chat/messages/<str:user_id>/<str:other_user_id>/', async_views.chat_messages, name='async-chat-messages'),
+    path('metrics/', prometheus_metrics, name='metrics'),
+    path('metrics/cache/', cache_metrics, name='cache-metrics'),
+    path('health/', health, name='health'),
+    path('ready/', readiness, name='readiness'),
 ]
@@ -1,32 +1,64 @@
 
 # views.py
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+import json
+import logging
+
+from rest_framework.decorators import api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from .models import Coupon, UserProfile, ChatMessage
-from .serializers import CouponSerializer, UserProfileSerializer, ChatMessageSerializer
-from datetime import date
-from django.db.models import Q
+from django.db import connection, transaction
+from .models import Coupon, UserProfile, ChatMessage, Conversation
+from .serializers import (
+    CouponSerializer,
+    UserProfileSerializer,
+    UserProfileSummarySerializer,
+    ChatMessageSerializer,
+    ConversationSerializer,
+    parse_expansion,
+    profile_prefetches,
+)
+from .pagination import CHAT_MAX_PAGE_SIZE, CHAT_PAGE_SIZE, CouponCursorPagination
+from .search import search_coupons
+from .cache import cached_payload, generation, get_cache, stats as cache_stats
+from .signals import coupon_availed, coupon_disavailed
+from .routers import read_from_replica
+from .bulk import upload_coupons
+from .parsers import CSVParser, read_csv
+from .streaming import STREAMING_RENDERER_CLASSES, stream_queryset, stream_sections
+from django.db.models import Max, Q, prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.utils import timezone
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotAuthenticated, NotFound, ParseError, PermissionDenied, ValidationError
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.hashers import make_password
+from .metrics import metrics_access_required, render_metrics
+from .authentication import issue_tokens, refresh_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def check_acting_user(request, user_id):
+    """
+    Allow a write on behalf of ``user_id`` only with that user's access token.
+    """
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    if request.user.userId != user_id:
+        raise PermissionDenied('You can only act as yourself.')
 
 # User views
 @api_view(['GET', 'POST'])
 def user_profile_list(request):
     if request.method == 'GET':
-        # Retrieve all user profiles
-        user_profiles = UserProfile.objects.all()
-        # Serialize user profiles without chat_messages
-        serializer = UserProfileSerializer(user_profiles, many=True)
-        # Exclude chat_messages when responding
-        response_data = [{'userId': profile['userId'],
-                          'userName': profile['userName'],
-                          'userImage': profile['userImage']} for profile in serializer.data]
-        return Response(response_data)
+        # Retrieve all user profiles, loading only the columns the summary needs
+        user_profiles = UserProfile.objects.only('userId', 'userName', 'userImage')
+        serializer = UserProfileSummarySerializer(user_profiles, many=True)
+        return Response(serializer.data)
 
     elif request.method == 'POST':
         email = request.data.get('email')
@@ -49,16 +81,19 @@ def user_profile_list(request):
 
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 def user_profile_detail(request, email):
-    # Check if a user profile with the provided email exists
-    user_profile = get_object_or_404(UserProfile, email=email)
-
     # Handle GET request for retrieving user profile details
     if request.method == 'GET':
-        serializer = UserProfileSerializer(user_profile)
+        # Load only the nested collections the client asked for, one query each
+        expand, fields = parse_expansion(request)
+        user_profile = get_object_or_404(UserProfile.objects.prefetch_related(*profile_prefetches(expand)), email=email)
+        serializer = UserProfileSerializer(user_profile, expand=expand, fields=fields)
         return Response(serializer.data)
 
+    # Check if a user profile with the provided email exists
+    user_profile = get_object_or_404(UserProfile, email=email)
+
     # Handle PUT and PATCH requests for updating user profile
-    elif request.method in ['PUT', 'PATCH']:
+    if request.method in ['PUT', 'PATCH']:
         serializer = UserProfileSerializer(user_profile, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -70,10 +105,20 @@ def user_profile_detail(request, email):
         user_profile.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-from django.http import Http404
 
-@api_view(['GET'])
-def user_login(request, email, password):
+@api_view(['POST'])
+def user_login(request):
+    """
+    POST: Check email and password and issue an access and a refresh token
+    along with the profile. The password hash is only checked here; other
+    requests send the access token instead.
+    """
+    expand, fields = parse_expansion(request)
+    email = request.data.get('email')
+    password = request.data.get('password')
+    if not email or not password:
+        return Response({"error": "Email and password are required."}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         # Check if a user profile with the provided email exists
         user_profile = UserProfile.objects.get(email=email)
@@ -84,53 +129,105 @@ def user_login(request, email, password):
     if not check_password(password, user_profile.password):
         return Response({"error": "Incorrect email or password."}, status=status.HTTP_401_UNAUTHORIZED)
 
-    # Handle GET request for retrieving user profile details
-    if request.method == 'GET':
-        serializer = UserProfileSerializer(user_profile)
-        return Response(serializer.data)
+    prefetch_related_objects([user_profile], *profile_prefetches(expand))
+    serializer = UserProfileSerializer(user_profile, expand=expand, fields=fields)
+    return Response({**issue_tokens(user_profile), 'profile': serializer.data})
 
 
+@api_view(['POST'])
+def refresh_token(request):
+    """
+    POST: Exchange a refresh token for a new access and refresh token.
+    """
+    tokens = refresh_tokens(request.data.get('refresh', ''))
+    if tokens is None:
+        return Response({"error": "Invalid or expired refresh token."}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(tokens)
 
-# Function to delete expired coupons
-def delete_expired_coupons():
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def current_user_profile(request):
     """
-    Delete expired coupons from the database.
+    GET: Profile of the user the access token was issued to.
     """
-    expired_coupons = Coupon.objects.filter(validityDate__lt=date.today())
-    expired_coupons.delete()
+    expand, fields = parse_expansion(request)
+    user_profile = get_object_or_404(
+        UserProfile.objects.prefetch_related(*profile_prefetches(expand)), userId=request.user.userId,
+    )
+    serializer = UserProfileSerializer(user_profile, expand=expand, fields=fields)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(STREAMING_RENDERER_CLASSES)
+@read_from_replica
+def user_data_export(request, email):
+    """
+    GET: Stream everything stored about the token's user: profile, coupons and chat messages.
+    """
+    user_profile = get_object_or_404(UserProfile, email=email)
+    if user_profile.userId != request.user.userId:
+        raise PermissionDenied('You can only export your own data.')
+    profile = UserProfileSerializer(
+        user_profile, expand=[], fields=['userId', 'userName', 'email', 'userImage', 'userImageVariants'],
+        context={'request': request},
+    ).data
+    return stream_sections(request, [
+        ('profile', profile),
+        ('uploadedCoupons', (user_profile.uploadedCoupons.order_by('id'), CouponSerializer)),
+        ('availedCoupons', (user_profile.availedCoupons.order_by('id'), CouponSerializer)),
+        ('chatMessages', (user_profile.chat_messages.order_by('id'), ChatMessageSerializer)),
+    ])
+
 
 # Coupon Views
+def coupon_filters(request):
+    """
+    Filter conditions of the coupon listing from its query parameters.
+    """
+    # Extract query parameters from the request
+    company_name = request.GET.get('companyName', None)
+    category = request.GET.get('category', None)
+    userId = request.GET.get('userId', None)
+
+    # Build the filter conditions
+    filters = Q()
+    if company_name:
+        filters &= Q(companyName__icontains=company_name)
+    if category:
+        filters &= Q(category=category)
+
+    # Exclude coupons uploaded by the current user
+    if userId:
+        filters &= ~Q(userId=userId)
+    return filters
+
+
+# Expired coupons are removed by the purge_expired_coupons management command;
+# the read paths below only filter them out.
 @api_view(['GET', 'POST'])
+@read_from_replica
 def coupon_list_create(request):
     """
-    GET: Retrieve a list of coupons based on query parameters.
+    GET: Retrieve a page of coupons based on query parameters.
     POST: Create a new coupon.
     """
-    # Call function to delete expired coupons
-    delete_expired_coupons()
-
     if request.method == 'GET':
-        # Extract query parameters from the request
-        company_name = request.GET.get('companyName', None)
-        category = request.GET.get('category', None)
-        userId = request.GET.get('userId', None)
-
-        # Build the filter conditions
-        filters = Q()
-        if company_name:
-            filters &= Q(companyName__icontains=company_name)
-        if category:
-            filters &= Q(category=category)
-
-        # Exclude coupons uploaded by the current user
-        if userId:
-            filters &= ~Q(userId=userId)
-
-        # Apply the filters
-        coupons = Coupon.objects.filter(filters, isAvailed=False)
-
-        serializer = CouponSerializer(coupons, many=True)
-        return Response(serializer.data)
+        filters = coupon_filters(request)
+
+        def build_page():
+            # Apply the filters, skipping coupons that have expired
+            coupons = Coupon.objects.active().filter(filters, isAvailed=False)
+
+            # Return one keyset page; the response carries the cursor for the next one
+            paginator = CouponCursorPagination()
+            page = paginator.paginate_queryset(coupons, request)
+            serializer = CouponSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data).data
+
+        return Response(cached_payload('coupon_list', request, build_page))
 
     elif request.method == 'POST':
         serializer = CouponSerializer(data=request.data)
@@ -143,24 +240,87 @@ def coupon_list_create(request):
                     serializer.validated_data['screenshots'] = None if not serializer.validated_data.get(
                         'screenshots') else serializer.validated_data['screenshots']
 
-                print("Serializer validated data:", serializer.validated_data)
+                logger.debug("Serializer validated data: %s", serializer.validated_data)
 
                 coupon = serializer.save()
                 user_profile = UserProfile.objects.get(userId=coupon.userId)
                 user_profile.uploadedCoupons.add(coupon)
 
-                print("Coupon saved successfully")
+                logger.info("Coupon %s saved", coupon.id)
 
                 return Response(serializer.data, status=201)
             else:
                 raise ValidationError(serializer.errors)
         except ValidationError as e:
-            print("Validation error:", e.detail)
+            logger.info("Validation error: %s", e.detail)
             return Response({'detail': e.detail}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            print("Exception:", str(e))
+        except Exception:
+            logger.exception("Could not create coupon")
             return Response({'detail': 'Internal Server Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(STREAMING_RENDERER_CLASSES)
+@read_from_replica
+def coupon_export(request):
+    """
+    GET: Stream every coupon of the listing (same filters, no pages), newest first.
+    """
+    coupons = Coupon.objects.active().filter(coupon_filters(request), isAvailed=False).order_by('-id')
+    return stream_queryset(request, coupons, CouponSerializer)
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser, CSVParser, MultiPartParser])
+def coupon_bulk_upload(request):
+    """
+    POST: Create many coupons from a JSON array or CSV rows.
+
+    CSV is accepted as a text/csv body or a multipart "file" field. With
+    ?stream=true the response is NDJSON with one progress line per batch
+    followed by a summary line.
+    """
+    if isinstance(request.data, list):
+        rows = request.data
+    elif 'file' in request.FILES:
+        rows = read_csv(request.FILES['file'])
+    elif request.content_type.startswith(CSVParser.media_type):
+        rows = request.data
+    else:
+        return Response({'detail': 'Expected a JSON array or a CSV file.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.GET.get('stream') in ('1', 'true'):
+        def progress():
+            processed = created = failed = 0
+            try:
+                for result in upload_coupons(rows):
+                    processed = result['processed']
+                    created += len(result['created'])
+                    failed += len(result['errors'])
+                    yield json.dumps(result) + '\n'
+            except ParseError as e:
+                yield json.dumps({'detail': e.detail}) + '\n'
+            yield json.dumps({'done': True, 'processed': processed, 'created': created, 'failed': failed}) + '\n'
+
+        return StreamingHttpResponse(progress(), content_type='application/x-ndjson')
+
+    created = []
+    errors = []
+    try:
+        for result in upload_coupons(rows):
+            created.extend(result['created'])
+            errors.extend(result['errors'])
+    except ParseError as e:
+        errors.append({'row': None, 'errors': {'non_field_errors': [e.detail]}})
+
+    if not errors:
+        response_status = status.HTTP_201_CREATED
+    elif not created:
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_207_MULTI_STATUS
+    return Response({'created': created, 'errors': errors}, status=response_status)
+
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 def coupon_detail(request, id):
     """
@@ -186,151 +346,203 @@ def coupon_detail(request, id):
         return Response(status=204)
     
     
+@api_view(['GET'])
+@read_from_replica
+def coupon_search(request):
+    """
+    GET: Search coupons by company name, category and description, best match first.
+    """
+    query = request.GET.get('q', '')
+    category = request.GET.get('category', None)
+    userId = request.GET.get('userId', None)
+
+    try:
+        limit = min(int(request.GET.get('limit', CouponCursorPagination.page_size)), CouponCursorPagination.max_page_size)
+    except ValueError:
+        limit = CouponCursorPagination.page_size
+
+    if not query.strip() or limit < 1:
+        return Response({'results': []})
+
+    filters = Q(isAvailed=False)
+    if category:
+        filters &= Q(category=category)
+    if userId:
+        filters &= ~Q(userId=userId)
+    coupons = Coupon.objects.active().filter(filters)
+
+    # The backend drops coupons failing the filters before it cuts the ranking to the limit
+    ids = search_coupons(query, limit=limit, queryset=coupons)
+    found = coupons.in_bulk(ids)
+
+    serializer = CouponSerializer([found[coupon_id] for coupon_id in ids if coupon_id in found], many=True)
+    return Response({'results': serializer.data})
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@read_from_replica
 def latest_coupons(request):
     """
-    GET: Retrieve the latest coupons.
+    GET: Retrieve a page of the latest coupons.
     """
-    try:
-        limit = int(request.GET.get('limit', 20))  # Default to 20 if limit is not provided
-        userId = request.GET.get('userId', None)  # Get the user ID from the request
+    userId = request.GET.get('userId', None)  # Get the user ID from the request
 
+    def build_page():
         # Get the latest coupons that are not availed and exclude those uploaded by the current user if userId is provided
-        coupons = Coupon.objects.filter(~Q(userId=userId) if userId else Q(), isAvailed=False).order_by('-id')[:limit]
+        coupons = Coupon.objects.active().filter(~Q(userId=userId) if userId else Q(), isAvailed=False)
 
-        serializer = CouponSerializer(coupons, many=True)
+        # Page size comes from ?limit= (default 20, capped by the paginator) and ?cursor= fetches the next page
+        paginator = CouponCursorPagination()
+        page = paginator.paginate_queryset(coupons, request)
 
-        if not coupons:  # Check if no coupons are found
-            return Response({'detail': 'No coupons found for the specified user.'}, status=status.HTTP_200_OK)
+        if not page:  # Check if no coupons are found
+            return {'detail': 'No coupons found for the specified user.'}
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    except Exception as e:
-        print("Error fetching coupons:", str(e))
+        serializer = CouponSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    try:
+        # The feed only changes when coupons are written, so serve it from the cache
+        return Response(cached_payload('latest_coupons', request, build_page), status=status.HTTP_200_OK)
+    except NotFound:
+        # Invalid cursor
+        raise
+    except Exception:
+        logger.exception("Error fetching coupons")
         return Response({'detail': 'An error occurred while fetching coupons.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def avail_coupon(request, id, user_id):
     """
-    POST: Avail a coupon.
+    POST: Avail a coupon for the token's user.
     """
-    coupon = get_object_or_404(Coupon, id=id)
+    check_acting_user(request, user_id)
     user_profile = get_object_or_404(UserProfile, userId=user_id)
 
-    # Check if the coupon is not already availed
-    if coupon.isAvailed:
-        return Response({'detail': 'Coupon is already availed'}, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        # Compare-and-set on isAvailed: only one concurrent request can flip it
+        claimed = Coupon.objects.active().filter(id=id, isAvailed=False).update(isAvailed=True)
 
-    # Add the coupon to the user's availedCoupons
-    user_profile.availedCoupons.add(coupon)
+        # Add the coupon to the user's availedCoupons
+        if claimed:
+            user_profile.availedCoupons.add(id)
+            transaction.on_commit(lambda: coupon_availed.send(sender=Coupon, coupon_id=id, user_id=user_id))
 
-    # Toggle isAvailed to True
-    coupon.isAvailed = True
-    coupon.save()
+    if not claimed:
+        coupon = get_object_or_404(Coupon, id=id)
+        if not coupon.isAvailed:
+            return Response({'detail': 'Coupon has expired'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': 'Coupon is already availed'}, status=status.HTTP_409_CONFLICT)
 
     return Response({'detail': 'Coupon added to availed coupons successfully'}, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def disavail_coupon(request, id, user_id):
     """
-    POST: Disavail a coupon.
+    POST: Disavail a coupon held by the token's user.
     """
-    coupon = get_object_or_404(Coupon, id=id)
+    check_acting_user(request, user_id)
     user_profile = get_object_or_404(UserProfile, userId=user_id)
 
-    # Check if the coupon is already availed
-    if not coupon.isAvailed:
-        return Response({'detail': 'Coupon is not availed'}, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        # Remove the coupon from the user's availedCoupons; only the holder can release it
+        released, _ = UserProfile.availedCoupons.through.objects.filter(
+            userprofile_id=user_profile.userId, coupon_id=id
+        ).delete()
 
-    # Remove the coupon from the user's availedCoupons
-    user_profile.availedCoupons.remove(coupon)
+        # Toggle isAvailed to False
+        if released:
+            Coupon.objects.filter(id=id).update(isAvailed=False)
+            transaction.on_commit(lambda: coupon_disavailed.send(sender=Coupon, coupon_id=id, user_id=user_id))
 
-    # Toggle isAvailed to False
-    coupon.isAvailed = False
-    coupon.save()
+    if not released:
+        coupon = get_object_or_404(Coupon, id=id)
+        if not coupon.isAvailed:
+            return Response({'detail': 'Coupon is not availed'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': 'Coupon is availed by another user'}, status=status.HTTP_409_CONFLICT)
 
     return Response({'detail': 'Coupon removed from availed coupons successfully'}, status=status.HTTP_200_OK)
 
 # Chat views
 @api_view(['GET', 'POST'])
+@read_from_replica
 def user_chat_list(request, user_id, other_user_id=None):
     """
-    GET: Retrieve a list of users with whom the current user has chatted.
-    POST: Create a new chat message.
+    GET: Retrieve the users the current user has chatted with, most recent chat first.
+    POST: Create a new chat message from the token's user.
     """
     if request.method == 'GET':
-        # Retrieve all user profiles related to the user with ID user_id
-        user_profiles = UserProfile.objects.filter(
-            chat_messages__sender__userId=user_id
-        ).distinct() | UserProfile.objects.filter(
-            chat_messages__receiver__userId=user_id
-        ).distinct()
-
-        # Exclude the current user's profile
-        user_profiles = user_profiles.exclude(userId=user_id)
-
-        # Serialize user profiles
-        serializer = UserProfileSerializer(user_profiles, many=True)
-        # Exclude chat_messages when responding
-        response_data = [{'userId': profile['userId'],
-                          'userName': profile['userName'],
-                          'userImage': profile['userImage']} for profile in serializer.data]
-        return Response(response_data)
+        # Read the denormalized inbox rows; excludes chats with oneself
+        conversations = Conversation.objects.filter(owner_id=user_id).exclude(peer_id=user_id).select_related(
+            'peer', 'last_message'
+        ).order_by('-last_timestamp')
+
+        serializer = ConversationSerializer(conversations, many=True)
+        return Response(serializer.data)
 
     elif request.method == 'POST':
+        check_acting_user(request, user_id)
         sender_profile = get_object_or_404(UserProfile, userId=user_id)
         receiver_profile = get_object_or_404(UserProfile, userId=other_user_id)
         serializer = ChatMessageSerializer(data=request.data)
 
         if serializer.is_valid():
             # Create a new chat message
-            chat_message = serializer.save(sender=sender_profile, receiver=receiver_profile, timestamp=timezone.now())
-
-            # Update user profiles with the new chat message
-            sender_profile.chat_messages.add(chat_message)
-            receiver_profile.chat_messages.add(chat_message)
+            serializer.save(sender=sender_profile, receiver=receiver_profile, timestamp=timezone.now())
 
             return Response(serializer.data, status=201)
 
         return Response(serializer.errors, status=400)
 
 @api_view(['GET', 'POST'])
+@read_from_replica
 def chat_messages(request, user_id, other_user_id):
     """
-    GET: Retrieve chat messages between two users.
-    POST: Create a new chat message.
+    GET: Retrieve a window of chat messages between two users, oldest first.
+         ?after_id= returns messages newer than that id, ?before_id= older ones,
+         otherwise the newest messages; ?limit= sets the window size.
+    POST: Create a new chat message from the token's user.
     """
     if request.method == 'GET':
+        try:
+            after_id = int(request.GET['after_id']) if 'after_id' in request.GET else None
+            before_id = int(request.GET['before_id']) if 'before_id' in request.GET else None
+            limit = int(request.GET.get('limit', CHAT_PAGE_SIZE))
+        except ValueError:
+            return Response({'detail': 'after_id, before_id and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, CHAT_MAX_PAGE_SIZE))
+
         # Retrieve chat messages between two users
-        chat_messages = ChatMessage.objects.filter(
+        conversation = ChatMessage.objects.filter(
             Q(sender_id=user_id, receiver_id=other_user_id) | Q(sender_id=other_user_id, receiver_id=user_id)
-        ).order_by('timestamp')
-
-        # If no messages exist, create an empty message and add it to user profiles
-        if not chat_messages.exists():
-            sender_profile = get_object_or_404(UserProfile, userId=user_id)
-            receiver_profile = get_object_or_404(UserProfile, userId=other_user_id)
-
-            empty_message = ChatMessage.objects.create(
-                content='',
-                sender=sender_profile,
-                receiver=receiver_profile
-            )
-
-            # Update user profiles with the new empty message
-            sender_profile.chat_messages.add(empty_message)
-            receiver_profile.chat_messages.add(empty_message)
-
-            # Update the chat_messages queryset
-            chat_messages = ChatMessage.objects.filter(
-                Q(sender_id=user_id, receiver_id=other_user_id) | Q(sender_id=other_user_id, receiver_id=user_id)
-            ).order_by('timestamp')
+        )
+
+        # Messages are never edited, so the newest id identifies the state of the conversation
+        last_id = conversation.aggregate(last_id=Max('id'))['last_id'] or 0
+        etag = quote_etag(f'{last_id}-{after_id}-{before_id}-{limit}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        if after_id is not None:
+            window = list(conversation.filter(id__gt=after_id).order_by('id')[:limit])
+        else:
+            if before_id is not None:
+                conversation = conversation.filter(id__lt=before_id)
+            window = list(conversation.order_by('-id')[:limit])[::-1]
 
-        serializer = ChatMessageSerializer(chat_messages, many=True)
-        return Response(serializer.data)
+        serializer = ChatMessageSerializer(window, many=True)
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
 
     elif request.method == 'POST':
+        check_acting_user(request, user_id)
         sender_id = user_id
         receiver_id = other_user_id
 
@@ -346,10 +558,6 @@ def chat_messages(request, user_id, other_user_id):
             # Create a new chat message
             chat_message = serializer.save(sender=sender_profile, receiver=receiver_profile)
 
-            # Update user profiles with the new chat message
-            sender_profile.chat_messages.add(chat_message)
-            receiver_profile.chat_messages.add(chat_message)
-
             return Response(serializer.data, status=201)
         else:
             # Handle default case for content and image
@@ -367,3 +575,69 @@ def chat_messages(request, user_id, other_user_id):
             return Response(ChatMessageSerializer(chat_message).data, status=201)
 
         return Response(serializer.errors, status=400)
+
+
+@api_view(['POST'])
+def mark_chat_read(request, user_id, other_user_id):
+    """
+    POST: Mark the chat with other_user_id as read for user_id.
+    """
+    Conversation.objects.filter(owner_id=user_id, peer_id=other_user_id, unread_count__gt=0).update(unread_count=0)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@metrics_access_required
+@api_view(['GET'])
+def cache_metrics(request):
+    """
+    GET: Hit/miss counters of the coupon payload cache in this process.
+    """
+    return Response(cache_stats.as_dict())
+
+
+@metrics_access_required
+def prometheus_metrics(request):
+    """
+    GET: Request and cache metrics of this process in Prometheus text format.
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Health views
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def health(request):
+    """
+    GET: Liveness probe; answers as long as the process serves requests.
+    """
+    return Response({'status': 'ok'})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def readiness(request):
+    """
+    GET: Readiness probe; checks the database and the coupon cache.
+    """
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'] = str(e)
+
+    try:
+        cache = get_cache()
+        cache.set('coupons:readiness', 1, 5)
+        checks['cache'] = 'ok' if cache.get('coupons:readiness') == 1 else 'unavailable'
+        generation()
+    except Exception as e:
+        checks['cache'] = str(e)
+
+    ready = all(result == 'ok' for result in checks.values())
+    return Response(
+        {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+        status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -22,16 +23,45 @@ SESSION_COOKIE_SECURE = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
 
-# Quick-start development settings - unsuitable for production
+# Media offload: set MEDIA_ACCEL_REDIRECT_PREFIX to an nginx internal location
+# aliased to MEDIA_ROOT (X-Accel-Redirect), or MEDIA_SENDFILE_HEADER to
+# X-Sendfile for Apache/lighttpd, so the web server sends files instead of Django.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+MEDIA_SENDFILE_HEADER = os.environ.get('MEDIA_SENDFILE_HEADER', '')
+
+# Browser cache lifetime in seconds for media that is not content-addressed
+MEDIA_CACHE_MAX_AGE = 3600
+
+# Uploads are stored once per unique content, named by their SHA-256
+STORAGES = {
+    'default': {
+        'BACKEND': 'Coupon.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Deployment settings come from the environment (see backend.yaml and the
+# Dockerfile); the defaults below are for local development only.
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
+
+def env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-2qy*bh2p%1-y7#=c*&cp3)))2as6ae(w9m)ri$&ycmtvv2a!n+'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-2qy*bh2p%1-y7#=c*&cp3)))2as6ae(w9m)ri$&ycmtvv2a!n+',
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG also makes every connection record all SQL it runs.
+DEBUG = env_flag('DJANGO_DEBUG', 'True')
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',') if host.strip()]
 
 
 # Application definition
@@ -49,6 +79,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Coupon.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +88,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'Coupon.routers.ReplicaPinningMiddleware',
+    'Coupon.ratelimit.RateLimitMiddleware',
 ]
 
 
@@ -90,6 +123,40 @@ CORS_ALLOW_HEADERS = [
 CORS_ALLOW_CREDENTIALS = True
 
 
+# API requests authenticate with signed bearer tokens (Coupon/authentication.py),
+# which are verified without a database query or password hash
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'Coupon.authentication.SignedTokenAuthentication',
+    ],
+}
+
+# Rate limits per URL name: token buckets per user and per client IP, as
+# "N/second|minute|hour|day" (bursts of up to N). Only the listed methods count.
+# User buckets apply to requests with a valid access token only; the routes
+# listed with one require a token for writes.
+RATE_LIMITS = {
+    'avail-coupon': {'methods': ['POST'], 'user': '20/minute', 'ip': '120/minute'},
+    'user-login': {'methods': ['POST'], 'ip': '20/minute'},
+    'token-refresh': {'methods': ['POST'], 'ip': '30/minute'},
+    'chat_messages': {'methods': ['POST'], 'user': '60/minute', 'ip': '300/minute'},
+    'async-chat-messages': {'methods': ['POST'], 'user': '60/minute', 'ip': '300/minute'},
+    'user_chat_list': {'methods': ['POST'], 'user': '60/minute', 'ip': '300/minute'},
+}
+
+# Coupon.ratelimit.MemoryBackend counts per process; Coupon.ratelimit.CacheBackend
+# shares the counts through the RATE_LIMIT_CACHE cache
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'Coupon.ratelimit.MemoryBackend')
+RATE_LIMIT_CACHE = 'ratelimit'
+
+# Number of reverse proxies in front of the app that append to X-Forwarded-For
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))
+
+# Token lifetimes in seconds
+ACCESS_TOKEN_LIFETIME = 15 * 60
+REFRESH_TOKEN_LIFETIME = 24 * 60 * 60
+
+
 ROOT_URLCONF = 'Coupons.urls'
 
 TEMPLATES = [
@@ -109,6 +176,32 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Coupons.wsgi.application'
+ASGI_APPLICATION = 'Coupons.asgi.application'
+
+# How the app is served (see gunicorn.conf.py) and by how many processes;
+# Coupon/checks.py rejects per-process rate limits and channel layers when
+# several processes serve it
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+SERVER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 1))
+SILENCED_SYSTEM_CHECKS = [check for check in os.environ.get('SILENCED_SYSTEM_CHECKS', '').split(',') if check]
+
+
+# Channel layer used to push chat messages to WebSocket clients. The in-memory
+# layer only reaches sockets served by the same process; set CHANNEL_REDIS_URL
+# to share it between processes (backend.yaml does).
+if os.environ.get('CHANNEL_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['CHANNEL_REDIS_URL']]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
 
 
 # Database
@@ -116,22 +209,40 @@ WSGI_APPLICATION = 'Coupons.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'django_testing',  # Should match the MYSQL_DATABASE in docker-compose.yml
-        'USER': 'admin',           # Should match the MYSQL_USER in docker-compose.yml
-        'PASSWORD': 'admin',       # Should match the MYSQL_PASSWORD in docker-compose.yml
-        'HOST': 'mysql',           # Should match the service name in docker-compose.yml
-        'PORT': '3306',
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.mysql'),
+        'NAME': os.environ.get('DB_NAME', 'django_testing'),  # Should match the MYSQL_DATABASE in docker-compose.yml
+        'USER': os.environ.get('DB_USER', 'admin'),           # Should match the MYSQL_USER in docker-compose.yml
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'admin'),   # Should match the MYSQL_PASSWORD in docker-compose.yml
+        'HOST': os.environ.get('DB_HOST', 'mysql'),           # Should match the service name in docker-compose.yml
+        'PORT': os.environ.get('DB_PORT', '3306'),
+        # Keep connections open between requests, checking them before reuse.
+        # Under ASGI each request queries from a new thread, so a kept
+        # connection would never be reused; close them after every request.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0 if os.environ.get('SERVER_MODE') == 'asgi' else 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replica. When DB_REPLICA_HOST (or, for a local SQLite pair, DB_REPLICA_NAME)
+# is set, views marked with @read_from_replica read from it (see Coupon/routers.py).
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['Coupon.routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it writes, so it sees
+# its own changes while the replica catches up
+REPLICA_PIN_SECONDS = 5
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.sqlite3',
-#         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
-# }
+# For a local SQLite database run with DB_ENGINE=django.db.backends.sqlite3 DB_NAME=db.sqlite3
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -168,6 +279,103 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Caches. The "coupons" cache holds serialized coupon feed and listing pages; it is
+# a local-memory LRU per process unless COUPON_CACHE_REDIS_URL points it at Redis.
+# "coupon_generation" holds the number that retires those pages on every write and
+# must be shared by all server processes: a database table (created by
+# `manage.py createcachetable`), or the same Redis.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'coupons': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'coupons',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'coupon_generation': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'coupon_cache_generation',
+        'TIMEOUT': None,
+    },
+}
+if os.environ.get('COUPON_CACHE_REDIS_URL'):
+    CACHES['coupons'] = CACHES['coupon_generation'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['COUPON_CACHE_REDIS_URL'],
+    }
+
+# Rate limit buckets for Coupon.ratelimit.CacheBackend; local memory stands in
+# for the shared store unless RATE_LIMIT_REDIS_URL is set
+CACHES['ratelimit'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'ratelimit',
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+}
+if os.environ.get('RATE_LIMIT_REDIS_URL'):
+    CACHES['ratelimit'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['RATE_LIMIT_REDIS_URL'],
+    }
+
+# Background tasks (see Coupon/tasks.py), run by `manage.py run_tasks`.
+# Queue -> tasks each worker process runs at once
+TASK_QUEUES = {
+    'default': 2,
+    'images': int(os.environ.get('IMAGE_VARIANT_WORKERS', 2)),
+    'maintenance': 1,
+}
+# Periodic tasks -> seconds between runs
+TASK_SCHEDULE = {
+    'Coupon.expiry.purge_expired_coupons_task': int(os.environ.get('EXPIRY_SWEEP_INTERVAL', 3600)),
+}
+# Seconds before a running task whose worker went away is run again
+TASK_LOCK_TIMEOUT = 600
+# Retry delays double from TASK_RETRY_BACKOFF seconds up to TASK_RETRY_BACKOFF_MAX
+TASK_RETRY_BACKOFF = 10
+TASK_RETRY_BACKOFF_MAX = 3600
+# Run tasks in-process after commit instead of queueing them (no worker needed).
+# Slow tasks then run on the request thread and Retry is not honoured.
+TASKS_EAGER = env_flag('TASKS_EAGER', 'False')
+
+# Seconds a cached coupon page may be served
+COUPON_CACHE_TIMEOUT = 300
+
+# Coupon search backend: Coupon.search.InvertedIndexBackend keeps an index in
+# each process, Coupon.search.SQLiteFTS5Backend uses an FTS5 table (SQLite only)
+COUPON_SEARCH_BACKEND = 'Coupon.search.InvertedIndexBackend'
+
+# Seconds before a process rebuilds its in-process search index, in a
+# background thread, to pick up changes made by other processes
+COUPON_SEARCH_MAX_AGE = 300
+
+# Bearer token the metrics endpoints require; without one they only answer
+# requests from the same host
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Requests slower than this many seconds, or running at least this many
+# queries, are logged with their slowest statements (see Coupon/metrics.py)
+METRICS_SLOW_REQUEST_SECONDS = float(os.environ.get('METRICS_SLOW_REQUEST_SECONDS', 1.0))
+METRICS_SLOW_REQUEST_QUERIES = int(os.environ.get('METRICS_SLOW_REQUEST_QUERIES', 50))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'Coupon': {
+            'handlers': ['console'],
+            'level': os.environ.get('COUPON_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
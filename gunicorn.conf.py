@@ -0,0 +1,62 @@
+"""
+Gunicorn configuration for production.
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE=wsgi (default) serves Coupons.wsgi with threaded workers.
+SERVER_MODE=asgi serves Coupons.asgi, including chat WebSockets, with
+uvicorn workers. Everything else is tuned through environment variables.
+
+On SIGTERM workers stop accepting connections and get GRACEFUL_TIMEOUT
+seconds to finish in-flight requests; SIGHUP starts fresh workers and
+retires the old ones the same way, for reloads without dropped requests.
+
+Before the workers start, `manage.py check` runs with the worker count, so
+state that would be kept per process (rate limits, channel layer) stops the
+server unless it is shared (see Coupon/checks.py).
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'Coupons.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'Coupons.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Recycle workers now and then so slow leaks cannot grow without bound;
+# the jitter keeps them from restarting all at once
+max_requests = int(os.environ.get('MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', 200))
+
+timeout = int(os.environ.get('WORKER_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('KEEPALIVE', 5))
+
+accesslog = os.environ.get('ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # In a subprocess, so the arbiter does not import the app and SIGHUP still loads fresh code
+    env = dict(os.environ, WEB_CONCURRENCY=str(server.cfg.workers), SERVER_MODE=SERVER_MODE)
+    manage = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manage.py')
+    if subprocess.run([sys.executable, manage, 'check'], env=env).returncode:
+        server.log.error('System checks failed for %d %s workers; not starting', server.cfg.workers, SERVER_MODE)
+        sys.exit(1)
+
+
+def post_worker_init(worker):
+    # Start building the in-process search index so the first search does not wait for all of it
+    from Coupon.search import get_backend
+    get_backend().warm()